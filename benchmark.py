@@ -0,0 +1,83 @@
+import os
+import time
+import argparse
+
+import numpy as np
+
+from genetics.model.genetic_evolution import GeneticEvolution, perform_fights
+from genetics.model.neuralnet import NeuralNetwork
+from genetics.model.genome import GenomeMatrix
+from genetics.model.fitness_func import fitness_func
+from genetics.config import Config
+
+from genetics.model.activation_function import FunctionMapper
+from genetics.model.cross_over import CrossOverMapper
+from genetics.model.action_selection import ActionSelectionMapper
+
+
+DECISION_INTERVALS = [1, 2, 3, 4, 6, 8]
+
+
+def load_population(population_size, activation_func, cross_over):
+    '''
+        Takes the serialized generation if there is one, since trained creatures behave differently from random ones.
+    '''
+    gen_deserialization_folder = Config.get("serialization.generation_deserialization_folder")
+    generation_path = os.path.join(gen_deserialization_folder, 'generation.data')
+    if os.path.exists(generation_path):
+        print(f'Using the generation from {generation_path}')
+        return GeneticEvolution.deserialize(generation_path).genomes
+
+    print(f'Using {population_size} random creatures')
+    layout = NeuralNetwork(Config.get("arena.creature_name_tag"), activation_func, cross_over, False).layout
+
+    return GenomeMatrix.random(layout, population_size)
+
+
+def rank_correlation(scores1, scores2):
+    ranks1 = np.argsort(np.argsort(scores1)).astype(np.float64)
+    ranks2 = np.argsort(np.argsort(scores2)).astype(np.float64)
+    if ranks1.std() == 0 or ranks2.std() == 0:
+        return 0.0
+
+    return float(np.corrcoef(ranks1, ranks2)[0, 1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluation speed and fitness for several decision intervals')
+    parser.add_argument('--fights', type=int, default=200, help='number of fights simulated for every decision interval')
+    parser.add_argument('--intervals', type=int, nargs='+', default=DECISION_INTERVALS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    activation_func = FunctionMapper.get_func(Config.get("algorithms.activation_func"))
+    cross_over = CrossOverMapper.get_cross_over(Config.get("algorithms.cross_over_type"))
+    action_selection = ActionSelectionMapper.get_action_selection(Config.get("algorithms.action_selection"))
+    genomes = load_population(Config.get("algorithms.population_size"), activation_func, cross_over)
+
+    # Every decision interval plays exactly the same fights from the same start
+    np.random.seed(args.seed)
+    first_nets = np.random.randint(len(genomes), size=args.fights)
+    second_nets = (first_nets + np.random.randint(1, len(genomes), size=args.fights)) % len(genomes)
+
+    print(f'{"interval":>8} {"fights/s":>9} {"speedup":>8} {"mean score":>11} {"rank corr":>10}')
+    baseline_time = None
+    baseline_scores = None
+    for interval in args.intervals:
+        np.random.seed(args.seed)
+        start = time.perf_counter()
+        first_scores, second_scores, _ = perform_fights(genomes, first_nets, second_nets, fitness_func, activation_func,
+                                                        action_selection, interval)
+        elapsed = time.perf_counter() - start
+
+        scores = np.zeros(len(genomes))
+        np.add.at(scores, first_nets, first_scores)
+        np.add.at(scores, second_nets, second_scores)
+
+        # The creatures have to be ranked the same way as with the first interval for the selection to make the same choices
+        if baseline_time is None:
+            baseline_time = elapsed
+            baseline_scores = scores
+
+        print(f'{interval:>8} {args.fights / elapsed:>9.1f} {baseline_time / elapsed:>7.2f}x '
+              f'{np.mean(first_scores + second_scores):>11.2f} {rank_correlation(baseline_scores, scores):>10.3f}')
@@ -0,0 +1,25 @@
+import os
+import shutil
+import argparse
+
+from genetics.model.genetic_evolution import GeneticEvolution
+from genetics.model.checkpoint import is_checkpoint
+from genetics.config import Config
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Turns pickled generations into checkpoints, the pickles are kept with a .pickle suffix')
+    parser.add_argument('paths', nargs='*', help='the pickled generations, by default generation.data of the serialization folder')
+    args = parser.parse_args()
+
+    paths = args.paths or [os.path.join(Config.get("serialization.generation_serialization_folder"), 'generation.data')]
+    for path in paths:
+        if is_checkpoint(path):
+            print(f'{path} is already a checkpoint')
+            continue
+
+        genetic_algorithm = GeneticEvolution.deserialize(path)
+        shutil.copyfile(path, path + '.pickle')
+        # The state of the RNG the pickle was written with is not known, the converted checkpoint does not set it
+        genetic_algorithm.serialize(path, random_state=False)
+        print(f'{path} converted, generation #{genetic_algorithm.current_generation} of {len(genetic_algorithm.genomes)} creatures')
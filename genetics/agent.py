@@ -4,9 +4,10 @@ import pygame
 import math
 from typing import List
 
-from .world import CollidableEntity, World, Bullet
+from .world import CollidableEntity, World
 from .geom import Vec2
 from .model.neuralnet import NeuralNetwork
+from .model.action_selection import ActionSelection, ProbabilityActionSelection, fight_generators
 
 
 EPSILON = 0.5
@@ -38,11 +39,82 @@ def norm_weight(value):
     return value / 1
 
 
+class Perception:
+    __slots__ = ('frame', 'x', 'y', 'enemy', 'enemy_distance', 'bullet', 'bullet_distance', 'enemy_direction', 'angle', 'enemy_in_fov')
+
+    def __init__(self):
+        '''
+            What an agent sees from its current position during one frame - the closest enemy and bullet and where the enemy is.
+            The scan of the world depends only on the position, the values depending on the angle are updated by look().
+            Every agent keeps a single instance and refreshes it in place.
+        '''
+        self.frame = -1
+        self.x = None
+        self.y = None
+        self.enemy = None
+        self.enemy_distance = None
+        self.bullet = None
+        self.bullet_distance = None
+        self.enemy_direction = None
+        self.angle = None
+        self.enemy_in_fov = None
+
+    def refresh(self, agent: Agent):
+        world = agent.world
+        position = agent.position
+        self.frame = world.frame
+        self.x = position.x
+        self.y = position.y
+
+        self.enemy, self.enemy_distance = world.nearest_body(position, agent)
+        self.bullet, self.bullet_distance = world.nearest_bullet(position, agent)
+
+        # We get weird results when not using unit vectors with atan2
+        dx = self.enemy.position.x - position.x
+        dy = self.enemy.position.y - position.y
+        norm = math.sqrt(dx ** 2 + dy ** 2)
+        self.enemy_direction = math.atan2(dy / norm, dx / norm)
+
+        self.look(agent.angle)
+
+    def is_valid(self, agent: Agent):
+        return self.frame == agent.world.frame and self.x == agent.position.x and self.y == agent.position.y
+
+    def look(self, angle):
+        self.angle = angle
+
+        ang = angle - self.enemy_direction
+
+        # Normalize the angle
+        if ang > math.pi or ang < -math.pi:
+            ang = math.atan2(math.sin(ang), math.cos(ang))
+
+        # 0.0 = we're 180 degrees away from the target ; 1.0 = spot on
+        self.enemy_in_fov = 1.0 - (abs(ang) / math.pi)
+
+
 class Agent(CollidableEntity):
-    def __init__(self, world: World, base_pos: Vec2, actions: List[Action], neural_net: NeuralNetwork, color):
-        super().__init__(world, base_pos, Vec2(10, 10))
+    __slots__ = ('actions', 'angle', 'linear_speed', 'angular_speed', 'reload_timer', 'neural_net', 'color', 'manual',
+                 'previous_action', 'previous_input', 'bullets_taken', 'successful_shots', 'shots_during_reloading',
+                 'shots_while_enemy_in_fov', 'close_to_corner', 'close_to_border', 'action_counter', 'same_action_counter',
+                 'most_repeated_action', 'most_repeated_counter', 'is_enemy_in_fov', 'enemy_is_close', 'nn_input_labels',
+                 'action_selection', 'decision_interval', 'ticks', '_perception', '_forward_angle', '_forward_vector')
+
+    def __init__(self, world: World, base_pos: Vec2, actions: List[Action], neural_net: NeuralNetwork, color,
+                 action_selection: ActionSelection = None, decision_interval: int = 1, generator: np.random.Generator = None):
+        super().__init__(world, base_pos.copy(), Vec2(10, 10))
+        # The random generator of the fight. The agent takes its start angle from it, so a seeded fight does not depend on np.random
+        if generator is None:
+            generator = fight_generators(1)[0]
+        # Agents of the same fight can share one action selection, its random numbers are used in the order the agents tick
+        if action_selection is None:
+            action_selection = ProbabilityActionSelection([generator])
+        self.action_selection = action_selection
+        # The network chooses an action every decision_interval ticks, the ticks in between repeat the last one
+        self.decision_interval = decision_interval
+        self.ticks = 0
         self.actions = actions
-        self.angle = np.random.uniform(low=0, high=math.pi * 2)
+        self.angle = generator.uniform(low=0, high=math.pi * 2)
         self.linear_speed = 0
         self.angular_speed = 0
         self.reload_timer = 0
@@ -67,50 +139,46 @@ class Agent(CollidableEntity):
 
         self.nn_input_labels = ['dst en', 'dst blt', 'x', 'y', 'rt angle', 'reload', 'en fov']
 
-    @property
-    def closest_entities(self):
-        en_dist = self.world.diagonal
-        bul_dist = self.world.diagonal
-        enemy = None
-        bullet = None
-
-        for e in self.world.entities:
-            if isinstance(e, Agent) and e != self:
-                edist = (self.position - e.position).norm()
-                if edist < en_dist:
-                    en_dist = edist
-                    enemy = e
-
-            if isinstance(e, Bullet) and e.owner != self:
-                bdist = (self.position - e.position).norm()
-                if bdist < bul_dist:
-                    bul_dist = bdist
-                    bullet = e
-
-        return enemy, en_dist, bullet, bul_dist
+        self._perception = Perception()
+        self._forward_angle = None
+        self._forward_vector = None
 
     @property
-    def forward_vector(self):
-        return Vec2(math.cos(self.angle), math.sin(self.angle))
+    def perception(self):
+        '''
+            The snapshot is computed once per frame and position. The world is scanned again only when the world advanced
+            or the agent moved, a rotation only updates the angle dependent values.
+        '''
+        perception = self._perception
+        if not perception.is_valid(self):
+            perception.refresh(self)
+        elif perception.angle != self.angle:
+            perception.look(self.angle)
+
+        return perception
 
     @property
-    def nn_inputs(self):
-        en, en_dist, bul, bul_dist = self.closest_entities
+    def closest_entities(self):
+        perception = self.perception
 
-        dist_enemy = en_dist / self.world.diagonal
-        dist_bullet = bul_dist / self.world.diagonal
+        return perception.enemy, perception.enemy_distance, perception.bullet, perception.bullet_distance
 
-        # We get weird results when not using unit vectors with atan2
-        d = (en.position - self.position).unit()
+    @property
+    def forward_vector(self):
+        # Shared between the calls until the angle changes, so it must not be modified
+        if self._forward_angle != self.angle:
+            self._forward_vector = Vec2(math.cos(self.angle), math.sin(self.angle))
+            self._forward_angle = self.angle
 
-        ang = self.angle - math.atan2(d.y, d.x)
+        return self._forward_vector
 
-        # Normalize the angle
-        if ang > math.pi or ang < -math.pi:
-            ang = math.atan2(math.sin(ang), math.cos(ang))
+    @property
+    def nn_inputs(self):
+        perception = self.perception
 
-        # 0.0 = we're 180 degrees away from the target ; 1.0 = spot on
-        enemy_in_fov = 1.0 - (abs(ang) / math.pi)
+        dist_enemy = perception.enemy_distance / self.world.diagonal
+        dist_bullet = perception.bullet_distance / self.world.diagonal
+        enemy_in_fov = perception.enemy_in_fov
 
         angle_norm = self.angle / (2.0 * math.pi) % 1
 
@@ -129,10 +197,12 @@ class Agent(CollidableEntity):
             self.shots_during_reloading += 1
             return
 
-        if self.nn_inputs[-1] > 0.8:
+        if self.perception.enemy_in_fov > 0.8:
             self.shots_while_enemy_in_fov += 1
 
-        self.world.add_entity(Bullet(self.world, self.position + self.forward_vector * 15, self.forward_vector, 250, power, self))
+        forward_vector = self.forward_vector
+        self.world.add_bullet(self.position.x + forward_vector.x * 15, self.position.y + forward_vector.y * 15,
+                              forward_vector, 250, power, self)
         self.reload_timer = MAX_RELOAD_TIME * power
 
     def forward(self, speed: float):
@@ -148,33 +218,32 @@ class Agent(CollidableEntity):
         self.action_counter[action_name] += 1
 
     def adjust_points(self):
-        for e in self.world.entities:
-            if isinstance(e, Bullet) and e.owner != self and self.check_collisions(e):
-                e.mark_destroy = True
-                self.bullets_taken += 1
-                e.owner.successful_shots += 1
+        bullets = self.world.bullets
+        for idx in self.world.colliding_bullets(self):
+            bullets.destroy[idx] = True
+            self.bullets_taken += 1
+            bullets.owner_of(idx).successful_shots += 1
 
     def check_position(self):
-        corner_offset = 0.05 * self.world.diagonal
-        x_offset = 0.05 * self.world.size.x
-        y_offset = 0.05 * self.world.size.y
+        world = self.world
+        position = self.position
 
-        corners = [Vec2(0, 0), Vec2(0, self.world.size.y), Vec2(self.world.size.x, 0), Vec2(self.world.size.x, self.world.size.y)]
-        for corner in corners:
-            if (self.position - corner).norm() < corner_offset:
+        for corner in world.corners:
+            if position.dist(corner) < world.corner_offset:
                 self.close_to_corner += 1
 
-        if (self.position.x < x_offset or
-                self.position.x > self.world.size.x - x_offset or
-                self.position.y < y_offset or
-                self.position.y > self.world.size.y - y_offset):
+        if (position.x < world.x_offset or
+                position.x > world.size.x - world.x_offset or
+                position.y < world.y_offset or
+                position.y > world.size.y - world.y_offset):
             self.close_to_border += 1
 
     def tick(self, delta_s: float):
-        previous_position = self.position
+        previous_x = self.position.x
+        previous_y = self.position.y
         # Check if there's still linear speed to apply
         if self.linear_speed > EPSILON:
-            self.position = self.position + (self.forward_vector * self.linear_speed * delta_s)
+            self.position.add_scaled_(self.forward_vector, self.linear_speed, delta_s)
             self.linear_speed -= DECEL_FACTOR * delta_s
         else:
             self.linear_speed = 0
@@ -192,12 +261,12 @@ class Agent(CollidableEntity):
         nn_inputs = self.nn_inputs
         self.previous_input = nn_inputs
 
-        if nn_inputs[-1] > 0.8:
+        perception = self.perception
+        if perception.enemy_in_fov > 0.8:
             self.is_enemy_in_fov += 1
-        en, en_dist, _, _ = self.closest_entities
-        if self.check_collisions(en):
-            self.position = previous_position
-        if en_dist < self.half_size.x * 2:
+        if perception.enemy_distance < self.half_size.x + perception.enemy.half_size.x:
+            self.position.set(previous_x, previous_y)
+        if perception.enemy_distance < self.half_size.x * 2:
             self.enemy_is_close += 1
 
         # Check if there's still angular speed to apply
@@ -225,8 +294,12 @@ class Agent(CollidableEntity):
         if self.manual:
             return
 
-        output = self.neural_net.forward(nn_inputs)
-        action_idx = np.random.choice(list(range(len(output))), p=output)
+        if self.ticks % self.decision_interval == 0 or self.previous_action < 0:
+            output = self.neural_net.forward(nn_inputs)
+            action_idx = self.action_selection.choose_one(output)
+        else:
+            action_idx = self.previous_action
+        self.ticks += 1
         
         self.actions[action_idx].do(self)
         self.add_action(self.actions[action_idx])
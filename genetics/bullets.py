@@ -0,0 +1,174 @@
+from __future__ import annotations
+import math
+import numpy as np
+import pygame
+
+from .spatial import SpatialGrid
+
+
+BULLET_HALF_SIZE = 2
+INITIAL_BULLET_CAPACITY = 32
+# Side of the grid cells the bullets are bucketed in, a few times the distance a bullet hits from
+BULLET_CELL_SIZE = 50
+
+
+class BulletPool:
+    def __init__(self, width, height, capacity=INITIAL_BULLET_CAPACITY):
+        '''
+            All bullets of a world kept in preallocated arrays - position, direction, speed, power, owner and a destroy flag.
+            The live bullets are always the first count slots. Destroyed bullets are dropped by compacting the arrays once per tick,
+            so there are never holes and nothing is allocated per shot. The capacity doubles when the pool is full.
+            The owners are stored as ids, owner_of() maps them back to the shooting entities.
+            nearest() and within() only look at the bullets in the grid cells around the point. The grid is built again
+            by the first query after the bullets were added, moved or dropped.
+        '''
+        self.count = 0
+        self.owners = []
+        self._owner_ids = {}
+
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.dx = np.zeros(capacity)
+        self.dy = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.power = np.zeros(capacity)
+        self.owner = np.zeros(capacity, dtype=np.int64)
+        self.destroy = np.zeros(capacity, dtype=bool)
+
+        self.grid = SpatialGrid(width, height, BULLET_CELL_SIZE)
+        self._grid_valid = False
+        # The live bullets as lists the grid reads them from, taken when it is built
+        self._grid_x = []
+        self._grid_y = []
+        self._grid_owner = []
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self.x)
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        for name in ('x', 'y', 'dx', 'dy', 'speed', 'power', 'owner', 'destroy'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            setattr(self, name, grown)
+
+    def owner_id(self, owner):
+        owner_id = self._owner_ids.get(owner)
+        if owner_id is None:
+            owner_id = len(self.owners)
+            self.owners.append(owner)
+            self._owner_ids[owner] = owner_id
+
+        return owner_id
+
+    def owner_of(self, idx):
+        return self.owners[self.owner[idx]]
+
+    def add(self, x, y, dx, dy, speed, power, owner):
+        if self.count == self.capacity:
+            self._grow()
+
+        idx = self.count
+        self.x[idx] = x
+        self.y[idx] = y
+        self.dx[idx] = dx
+        self.dy[idx] = dy
+        self.speed[idx] = speed
+        self.power[idx] = power
+        self.owner[idx] = self.owner_id(owner)
+        self.destroy[idx] = False
+        self.count += 1
+        self._grid_valid = False
+
+        return idx
+
+    def remove_destroyed(self):
+        n = self.count
+        keep = ~self.destroy[:n]
+        kept = int(np.count_nonzero(keep))
+        if kept == n:
+            return
+
+        for array in (self.x, self.y, self.dx, self.dy, self.speed, self.power, self.owner):
+            array[:kept] = array[:n][keep]
+        self.destroy[:kept] = False
+        self.count = kept
+        self._grid_valid = False
+
+    def tick(self, delta_s, width, height):
+        '''
+            Moves every bullet and marks the ones which left the world. They are dropped by the next remove_destroyed.
+        '''
+        n = self.count
+        if n == 0:
+            return
+
+        x = self.x[:n]
+        y = self.y[:n]
+        x += self.dx[:n] * self.speed[:n] * delta_s
+        y += self.dy[:n] * self.speed[:n] * delta_s
+
+        self.destroy[:n] |= (x > width) | (x < 0) | (y > height) | (y < 0)
+        self._grid_valid = False
+
+    def _indexed_grid(self):
+        if not self._grid_valid:
+            n = self.count
+            self._grid_x = self.x[:n].tolist()
+            self._grid_y = self.y[:n].tolist()
+            self._grid_owner = self.owner[:n].tolist()
+            self.grid.build(self._grid_x, self._grid_y)
+            self._grid_valid = True
+
+        return self.grid
+
+    def _dist2_of(self, x, y, ignore_owner):
+        '''
+            The squared distance of a bullet to (x, y) for the grid, inf for the bullets shot by ignore_owner.
+        '''
+        xs = self._grid_x
+        ys = self._grid_y
+        owners = self._grid_owner
+        owner_id = self._owner_ids.get(ignore_owner)
+
+        def dist2_of(idx):
+            if owners[idx] == owner_id:
+                return math.inf
+
+            dx = x - xs[idx]
+            dy = y - ys[idx]
+            return dx * dx + dy * dy
+
+        return dist2_of
+
+    def nearest(self, x, y, ignore_owner=None):
+        '''
+            Returns the index of the closest bullet not shot by ignore_owner and its squared distance to (x, y),
+            or (None, None) when there is no such bullet.
+        '''
+        if self.count == 0:
+            return None, None
+
+        grid = self._indexed_grid()
+
+        return grid.nearest(x, y, self._dist2_of(x, y, ignore_owner))
+
+    def within(self, x, y, radius, ignore_owner=None):
+        '''
+            Returns the indices of the bullets not shot by ignore_owner which are closer than radius to (x, y).
+        '''
+        if self.count == 0:
+            return []
+
+        grid = self._indexed_grid()
+
+        return grid.within(x, y, radius, self._dist2_of(x, y, ignore_owner))
+
+    def draw(self, surface):
+        for idx in range(self.count):
+            pygame.draw.circle(surface, (0, 0, 0), [int(self.x[idx]), int(self.y[idx])], BULLET_HALF_SIZE)
@@ -4,6 +4,8 @@ import math
 
 
 class Vec2:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x: float=0, y: float=0):
         self.x = x
         self.y = y
@@ -11,6 +13,44 @@ class Vec2:
     def norm(self):
         return math.sqrt(self.x ** 2 + self.y ** 2)
 
+    def dist2(self, v: Vec2) -> float:
+        # Same as (self - v).norm() ** 2 before the square root, without the temporary vector
+        return (self.x - v.x) ** 2 + (self.y - v.y) ** 2
+
+    def dist(self, v: Vec2) -> float:
+        return math.sqrt(self.dist2(v))
+
+    def copy(self) -> Vec2:
+        return Vec2(self.x, self.y)
+
+    # The methods below change the vector in place and return it, so they can be chained
+
+    def set(self, x: float, y: float) -> Vec2:
+        self.x = x
+        self.y = y
+        return self
+
+    def iadd(self, v: Vec2) -> Vec2:
+        self.x += v.x
+        self.y += v.y
+        return self
+
+    def isub(self, v: Vec2) -> Vec2:
+        self.x -= v.x
+        self.y -= v.y
+        return self
+
+    def scale_(self, factor: float) -> Vec2:
+        self.x *= factor
+        self.y *= factor
+        return self
+
+    def add_scaled_(self, v: Vec2, factor: float, second_factor: float=1.0) -> Vec2:
+        # self + v * factor * second_factor, multiplied in the same order as the operators would do it
+        self.x += v.x * factor * second_factor
+        self.y += v.y * factor * second_factor
+        return self
+
     def unit(self):
         return self / self.norm()
 
@@ -0,0 +1,125 @@
+import numpy as np
+
+# How many uniform numbers are drawn at once for every fight
+UNIFORM_BLOCK_SIZE = 256
+
+
+class ActionSelectionMapper:
+    mapper = {}
+
+    def __init__(self, action_selection_type):
+        self.action_selection_type = action_selection_type
+
+    def __call__(self, action_selection_class):
+        ActionSelectionMapper.mapper[self.action_selection_type] = action_selection_class
+
+        return action_selection_class
+
+    @classmethod
+    def get_action_selection(self, action_selection_type):
+        return self.mapper[action_selection_type]
+
+
+def fight_generators(fights, seeds=None):
+    '''
+        One independent random generator per fight. Without seeds they come from the global numpy RNG,
+        so np.random.seed still makes the fights repeatable.
+    '''
+    if seeds is None:
+        seeds = np.random.randint(0, 2 ** 32, size=fights, dtype=np.int64)
+
+    return [np.random.default_rng(seed) for seed in seeds]
+
+
+class ActionSelection:
+    def __init__(self, generators):
+        '''
+            Chooses the action of every fight from the output of the networks.
+            generators - a numpy Generator per fight, the random numbers of a fight come only from its own generator.
+        '''
+        self.generators = generators
+
+    def take(self, fights):
+        '''
+            Returns the action selection of only the given fights, used when the other fights of a batch are finished.
+        '''
+        return type(self)([self.generators[fight] for fight in fights])
+
+    def choose(self, probabilities):
+        '''
+            probabilities - array of shape (fights, actions). Returns the index of the chosen action for every fight.
+        '''
+        raise NotImplementedError()
+
+    def choose_one(self, probabilities):
+        '''
+            Same as choose for a world with a single fight and a 1-D output.
+        '''
+        raise NotImplementedError()
+
+
+@ActionSelectionMapper("probability")
+class ProbabilityActionSelection(ActionSelection):
+    '''
+        The action is drawn with the probabilities the network outputs - the same inverse-CDF draw np.random.choice performs.
+        The uniform numbers are drawn in blocks, so the generators are called once per UNIFORM_BLOCK_SIZE decisions.
+    '''
+    def __init__(self, generators, block_size=UNIFORM_BLOCK_SIZE):
+        super().__init__(generators)
+        self.block_size = block_size
+        self.uniforms = np.empty((len(generators), 0))
+        self.position = 0
+
+    def take(self, fights):
+        selection = ProbabilityActionSelection([self.generators[fight] for fight in fights], self.block_size)
+        selection.uniforms = self.uniforms[fights]
+        selection.position = self.position
+
+        return selection
+
+    def _next_uniforms(self):
+        if self.position == self.uniforms.shape[1]:
+            self.uniforms = np.stack([generator.random(self.block_size) for generator in self.generators])
+            self.position = 0
+
+        uniforms = self.uniforms[:, self.position]
+        self.position += 1
+
+        return uniforms
+
+    def choose(self, probabilities):
+        cdf = np.cumsum(probabilities, axis=1)
+        cdf /= cdf[:, -1:]
+        dice = self._next_uniforms()
+
+        return np.minimum((cdf <= dice[:, None]).sum(axis=1), probabilities.shape[1] - 1)
+
+    def choose_one(self, probabilities):
+        dice = float(self._next_uniforms()[0])
+        probabilities = probabilities.tolist()
+
+        # The cumulative sum is built in the same order as np.cumsum, so the comparison matches choose() exactly
+        cdf = []
+        total = 0.0
+        for probability in probabilities:
+            total += probability
+            cdf.append(total)
+
+        action_idx = 0
+        for value in cdf:
+            if value / total <= dice:
+                action_idx += 1
+
+        return min(action_idx, len(probabilities) - 1)
+
+
+@ActionSelectionMapper("max_value")
+class MaxValueActionSelection(ActionSelection):
+    '''
+        Always takes the action with the highest output. No random numbers are used.
+    '''
+    def choose(self, probabilities):
+        return np.argmax(probabilities, axis=1)
+
+    def choose_one(self, probabilities):
+        return int(np.argmax(probabilities))
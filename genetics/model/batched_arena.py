@@ -0,0 +1,382 @@
+import math
+import numpy as np
+
+from genetics.agent import EPSILON, DECEL_FACTOR, MAX_RELOAD_TIME, ANG_DECEL_FACTOR
+
+from .agent_metrics import AgentMetrics
+from .neuralnet import NeuralNetworkBatch
+from .action_selection import ProbabilityActionSelection, fight_generators
+from .termination import FightProgress, TERMINATION_CHECK_INTERVAL, finished_fights
+
+
+# The same arena EvaluationArena builds: a 500x500 world with the agents facing each other
+WORLD_SIZE = (500, 500)
+START_POSITIONS = ((50, 250), (450, 250))
+AGENT_RADIUS = 10
+BULLET_RADIUS = 2
+BULLET_SPEED = 250
+BULLET_OFFSET = 15
+INITIAL_BULLET_CAPACITY = 8
+
+# The action list of EvaluationArena: [MoveAction(80), RotateAction(pi/4), RotateAction(-pi/4), ShootAction(1.0)]
+MOVE_SPEED = 80
+ROTATION_SPEED = math.pi * 0.25
+SHOOT_POWER = 1.0
+MOVE, ROTATE_CW, ROTATE_CCW, SHOOT = range(4)
+ACTION_NAMES = ['MoveAction', 'RotateAction', 'RotateAction', 'ShootAction']
+
+
+class AgentRecord:
+    '''
+        Holds the counters an Agent accumulates during a fight.
+        AgentMetrics only reads these attributes, so it can be built from a batched fight as well.
+    '''
+    def __init__(self, action_counter, bullets_taken, successful_shots, shots_during_reloading, shots_while_enemy_in_fov,
+                 close_to_corner, close_to_border, most_repeated_action, most_repeated_counter, is_enemy_in_fov, enemy_is_close):
+        self.action_counter = action_counter
+        self.bullets_taken = bullets_taken
+        self.successful_shots = successful_shots
+        self.shots_during_reloading = shots_during_reloading
+        self.shots_while_enemy_in_fov = shots_while_enemy_in_fov
+        self.close_to_corner = close_to_corner
+        self.close_to_border = close_to_border
+        self.most_repeated_action = most_repeated_action
+        self.most_repeated_counter = most_repeated_counter
+        self.is_enemy_in_fov = is_enemy_in_fov
+        self.enemy_is_close = enemy_is_close
+
+
+class BatchedEvaluationArena:
+    '''
+        Simulates many EvaluationArena fights in lockstep.
+        Every fight has two agent slots: nets1[i] plays from the left start position and nets2[i] from the right one.
+        Both sides are either lists of networks or NeuralNetworkBatch objects.
+        The state of all fights is kept in arrays of shape (fights, 2) for the agents and (fights, capacity) for the bullets.
+
+        A frame follows the order of World.update: the first agents of all fights tick, then the second ones, then the bullets.
+        Agent.tick, Agent.adjust_points and the bullet pool update are reproduced step by step.
+        Every fight draws its actions from its own random generator.
+        The networks choose an action every decision_interval frames, the frames in between repeat the last action.
+        A fight which one of the terminations declares finished is taken out of the batch, the rest go on without it.
+        Every fight takes its random numbers, the start angles included, only from its own generator.
+        With seeds the same networks with the same seed always play the same fight.
+    '''
+    def __init__(self, nets1, nets2, action_selection=ProbabilityActionSelection, decision_interval=1, terminations=(), seeds=None):
+        self.nets = [nets if isinstance(nets, NeuralNetworkBatch) else NeuralNetworkBatch.from_networks(nets) for nets in (nets1, nets2)]
+        if len(self.nets[0]) != len(self.nets[1]):
+            raise ValueError(f'Both sides need the same number of networks, got {len(self.nets[0])} and {len(self.nets[1])}')
+
+        self.fights = len(self.nets[0])
+        self.size_x, self.size_y = WORLD_SIZE
+        self.diagonal = math.sqrt(self.size_x ** 2 + self.size_y ** 2)
+        # Created before the agents, the same way EvaluationArena does it
+        generators = fight_generators(self.fights, seeds)
+        self.action_selection = action_selection(generators)
+        self.decision_interval = decision_interval
+        self.frame = 0
+        self.terminations = [termination() for termination in terminations]
+        # Index every fight of the batch had when the arena was created, the fights keep it when finished ones are dropped
+        self.fight_ids = np.arange(self.fights)
+        self.frames_played = np.zeros(self.fights, dtype=np.int64)
+
+        shape = (self.fights, 2)
+        self.pos_x = np.empty(shape)
+        self.pos_y = np.empty(shape)
+        for slot, (x, y) in enumerate(START_POSITIONS):
+            self.pos_x[:, slot] = x
+            self.pos_y[:, slot] = y
+        self.angle = np.array([generator.uniform(low=0, high=math.pi * 2, size=2) for generator in generators]).reshape(shape)
+        self.linear_speed = np.zeros(shape)
+        self.angular_speed = np.zeros(shape)
+        self.reload_timer = np.zeros(shape)
+
+        self.bullets_taken = np.zeros(shape, dtype=np.int64)
+        self.successful_shots = np.zeros(shape, dtype=np.int64)
+        self.shots_during_reloading = np.zeros(shape, dtype=np.int64)
+        self.shots_while_enemy_in_fov = np.zeros(shape, dtype=np.int64)
+        self.close_to_corner = np.zeros(shape, dtype=np.int64)
+        self.close_to_border = np.zeros(shape, dtype=np.int64)
+        self.is_enemy_in_fov = np.zeros(shape, dtype=np.int64)
+        self.enemy_is_close = np.zeros(shape, dtype=np.int64)
+        self.action_counts = np.zeros((self.fights, 2, len(ACTION_NAMES)), dtype=np.int64)
+        self.previous_action = np.full(shape, -1, dtype=np.int64)
+        self.same_action_counter = np.zeros(shape, dtype=np.int64)
+        self.most_repeated_action = np.full(shape, -1, dtype=np.int64)
+        self.most_repeated_counter = np.zeros(shape, dtype=np.int64)
+        self.last_shot_frame = np.zeros(self.fights, dtype=np.int64)
+        self.corner_streak = np.zeros(shape, dtype=np.int64)
+
+        self.bullet_x = np.zeros((self.fights, INITIAL_BULLET_CAPACITY))
+        self.bullet_y = np.zeros((self.fights, INITIAL_BULLET_CAPACITY))
+        self.bullet_dx = np.zeros((self.fights, INITIAL_BULLET_CAPACITY))
+        self.bullet_dy = np.zeros((self.fights, INITIAL_BULLET_CAPACITY))
+        self.bullet_owner = np.zeros((self.fights, INITIAL_BULLET_CAPACITY), dtype=np.int8)
+        self.bullet_alive = np.zeros((self.fights, INITIAL_BULLET_CAPACITY), dtype=bool)
+        self.bullet_destroy = np.zeros((self.fights, INITIAL_BULLET_CAPACITY), dtype=bool)
+
+        self.corners = [(0, 0), (0, self.size_y), (self.size_x, 0), (self.size_x, self.size_y)]
+        self.corner_offset = 0.05 * self.diagonal
+        self.x_offset = 0.05 * self.size_x
+        self.y_offset = 0.05 * self.size_y
+
+    def update(self, delta_s: float):
+        self._tick_agents(0, delta_s)
+        self._tick_agents(1, delta_s)
+        self._tick_bullets(delta_s)
+        self.frame += 1
+
+    def perform_fight(self, frames):
+        '''
+            Returns the metrics of both agents for every fight in the order the networks were given.
+            The metrics of a fight stopped early are computed over the frames it played, frames_played holds them afterwards.
+        '''
+        dt_60_fps = 1 / 60
+        dt_60_fps *= 1.5
+
+        results = [None] * len(self.fight_ids)
+
+        tick = 0
+        while tick < frames and self.fights > 0:
+            self.update(dt_60_fps)
+            tick += 1
+
+            if self.terminations and tick % TERMINATION_CHECK_INTERVAL == 0 and tick < frames:
+                finished = finished_fights(self.terminations, self._progress(tick, frames, dt_60_fps))
+                if finished.any():
+                    self._record_results(results, np.flatnonzero(finished), tick)
+                    self._keep(np.flatnonzero(~finished))
+
+        self._record_results(results, np.arange(self.fights), tick)
+
+        return results
+
+    def _progress(self, tick, frames, delta_s):
+        return FightProgress(tick, frames, (frames - tick) * delta_s, self.last_shot_frame, self.bullet_alive.sum(axis=1),
+                             self.corner_streak, self.successful_shots)
+
+    def _record_results(self, results, fights, frames_played):
+        for fight in fights:
+            fight_id = self.fight_ids[fight]
+            self.frames_played[fight_id] = frames_played
+            results[fight_id] = (AgentMetrics(self._agent_record(fight, 0), frames_played),
+                                 AgentMetrics(self._agent_record(fight, 1), frames_played))
+
+    def _keep(self, fights):
+        '''
+            Drops every fight except the given ones from the state arrays, the networks and the action selection.
+        '''
+        for name, value in list(vars(self).items()):
+            if name != 'frames_played' and isinstance(value, np.ndarray) and value.ndim > 0 and len(value) == self.fights:
+                setattr(self, name, value[fights])
+
+        self.nets = [nets.take(fights) for nets in self.nets]
+        self.action_selection = self.action_selection.take(fights)
+        self.fights = len(fights)
+
+    def _enemy_in_fov(self, slot, fights, x, y, angle):
+        enemy = 1 - slot
+        dx = self.pos_x[fights, enemy] - x
+        dy = self.pos_y[fights, enemy] - y
+        distance = np.sqrt(dx ** 2 + dy ** 2)
+
+        # We get weird results when not using unit vectors with atan2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ang = angle - np.arctan2(dy / distance, dx / distance)
+
+        # Normalize the angle
+        outside = (ang > math.pi) | (ang < -math.pi)
+        ang = np.where(outside, np.arctan2(np.sin(ang), np.cos(ang)), ang)
+
+        # 0.0 = we're 180 degrees away from the target ; 1.0 = spot on
+        return 1.0 - (np.abs(ang) / math.pi), distance
+
+    def _closest_bullet_distance(self, slot, x, y):
+        dx = self.bullet_x - x[:, None]
+        dy = self.bullet_y - y[:, None]
+        distance = np.sqrt(dx ** 2 + dy ** 2)
+
+        enemy_bullets = self.bullet_alive & (self.bullet_owner != slot)
+        distance = np.where(enemy_bullets, distance, self.diagonal)
+
+        return np.minimum(distance.min(axis=1), self.diagonal), enemy_bullets, distance
+
+    def _tick_agents(self, slot, delta_s):
+        x = self.pos_x[:, slot]
+        y = self.pos_y[:, slot]
+        angle = self.angle[:, slot]
+
+        # Check if there's still linear speed to apply
+        moving = self.linear_speed[:, slot] > EPSILON
+        speed = self.linear_speed[:, slot]
+        new_x = np.where(moving, x + (np.cos(angle) * speed * delta_s), x)
+        new_y = np.where(moving, y + (np.sin(angle) * speed * delta_s), y)
+        self.linear_speed[:, slot] = np.where(moving, speed - DECEL_FACTOR * delta_s, 0)
+
+        new_x = np.where(new_x + AGENT_RADIUS > self.size_x, self.size_x - AGENT_RADIUS,
+                         np.where(new_x - AGENT_RADIUS < 0, AGENT_RADIUS, new_x))
+        new_y = np.where(new_y + AGENT_RADIUS > self.size_y, self.size_y - AGENT_RADIUS,
+                         np.where(new_y - AGENT_RADIUS < 0, AGENT_RADIUS, new_y))
+
+        # An agent standing still clamps its previous position as well since Agent.tick shares the Vec2
+        previous_x = np.where(moving, x, new_x)
+        previous_y = np.where(moving, y, new_y)
+
+        enemy_in_fov, en_dist = self._enemy_in_fov(slot, slice(None), new_x, new_y, angle)
+        bul_dist, _, _ = self._closest_bullet_distance(slot, new_x, new_y)
+        nn_inputs = np.stack([
+            en_dist / self.diagonal,
+            bul_dist / self.diagonal,
+            new_x / self.size_x,
+            new_y / self.size_y,
+            angle / (2.0 * math.pi) % 1,
+            self.reload_timer[:, slot] / MAX_RELOAD_TIME,
+            enemy_in_fov], axis=1)
+
+        self.is_enemy_in_fov[:, slot] += enemy_in_fov > 0.8
+        collided = en_dist < AGENT_RADIUS * 2
+        self.pos_x[:, slot] = np.where(collided, previous_x, new_x)
+        self.pos_y[:, slot] = np.where(collided, previous_y, new_y)
+        self.enemy_is_close[:, slot] += collided
+
+        # Check if there's still angular speed to apply
+        angular_speed = self.angular_speed[:, slot]
+        turning = np.abs(angular_speed) > EPSILON
+        self.angle[:, slot] = np.where(turning, angle + (angular_speed * delta_s), angle)
+        decelerated = np.where(angular_speed > 0, angular_speed - ANG_DECEL_FACTOR * delta_s, angular_speed + ANG_DECEL_FACTOR * delta_s)
+        self.angular_speed[:, slot] = np.where(turning, decelerated, 0)
+
+        reload_timer = self.reload_timer[:, slot]
+        reload_timer = np.where(reload_timer > 0, reload_timer - delta_s, reload_timer)
+        self.reload_timer[:, slot] = np.where(reload_timer < 0, 0, reload_timer)
+
+        self._adjust_points(slot)
+        self._check_position(slot)
+
+        if self.frame % self.decision_interval == 0:
+            output = self._forward(slot, nn_inputs)
+            action_idx = self.action_selection.choose(output)
+        else:
+            action_idx = self.previous_action[:, slot]
+        self._do_actions(slot, action_idx)
+
+        self.action_counts[np.arange(self.fights), slot, action_idx] += 1
+        same_action = self.previous_action[:, slot] == action_idx
+        self.same_action_counter[:, slot] = np.where(same_action, self.same_action_counter[:, slot] + 1, 1)
+        self.previous_action[:, slot] = action_idx
+
+        repeated_more = self.same_action_counter[:, slot] > self.most_repeated_counter[:, slot]
+        self.most_repeated_counter[:, slot] = np.where(repeated_more, self.same_action_counter[:, slot], self.most_repeated_counter[:, slot])
+        self.most_repeated_action[:, slot] = np.where(repeated_more, action_idx, self.most_repeated_action[:, slot])
+
+    def _adjust_points(self, slot):
+        x = self.pos_x[:, slot]
+        y = self.pos_y[:, slot]
+        _, enemy_bullets, distance = self._closest_bullet_distance(slot, x, y)
+
+        hits = enemy_bullets & (distance < AGENT_RADIUS + BULLET_RADIUS)
+        self.bullet_destroy |= hits
+        hits_count = hits.sum(axis=1)
+        self.bullets_taken[:, slot] += hits_count
+        self.successful_shots[:, 1 - slot] += hits_count
+
+    def _check_position(self, slot):
+        x = self.pos_x[:, slot]
+        y = self.pos_y[:, slot]
+
+        near_corner = np.zeros(self.fights, dtype=bool)
+        for corner_x, corner_y in self.corners:
+            near = np.sqrt((x - corner_x) ** 2 + (y - corner_y) ** 2) < self.corner_offset
+            self.close_to_corner[:, slot] += near
+            near_corner |= near
+
+        self.corner_streak[:, slot] = np.where(near_corner, self.corner_streak[:, slot] + 1, 0)
+        self.close_to_border[:, slot] += ((x < self.x_offset) |
+                                          (x > self.size_x - self.x_offset) |
+                                          (y < self.y_offset) |
+                                          (y > self.size_y - self.y_offset))
+
+    def _forward(self, slot, nn_inputs):
+        return self.nets[slot].forward(nn_inputs)
+
+    def _do_actions(self, slot, action_idx):
+        move = action_idx == MOVE
+        self.linear_speed[:, slot] = np.where(move, MOVE_SPEED, self.linear_speed[:, slot])
+
+        angular_speed = self.angular_speed[:, slot]
+        angular_speed = np.where(action_idx == ROTATE_CW, ROTATION_SPEED, angular_speed)
+        self.angular_speed[:, slot] = np.where(action_idx == ROTATE_CCW, -ROTATION_SPEED, angular_speed)
+
+        shoot = action_idx == SHOOT
+        reloading = self.reload_timer[:, slot] > 0
+        self.shots_during_reloading[:, slot] += shoot & reloading
+
+        shooting = np.flatnonzero(shoot & ~reloading)
+        if len(shooting) == 0:
+            return
+
+        x = self.pos_x[shooting, slot]
+        y = self.pos_y[shooting, slot]
+        angle = self.angle[shooting, slot]
+        enemy_in_fov, _ = self._enemy_in_fov(slot, shooting, x, y, angle)
+        self.shots_while_enemy_in_fov[shooting, slot] += enemy_in_fov > 0.8
+
+        forward_x = np.cos(angle)
+        forward_y = np.sin(angle)
+        self._spawn_bullets(shooting, slot, x + forward_x * BULLET_OFFSET, y + forward_y * BULLET_OFFSET, forward_x, forward_y)
+        self.reload_timer[shooting, slot] = MAX_RELOAD_TIME * SHOOT_POWER
+        self.last_shot_frame[shooting] = self.frame + 1
+
+    def _spawn_bullets(self, fights, slot, x, y, forward_x, forward_y):
+        free = ~self.bullet_alive[fights]
+        if not free.any(axis=1).all():
+            self._grow_bullets()
+            free = ~self.bullet_alive[fights]
+
+        free_slot = np.argmax(free, axis=1)
+        self.bullet_x[fights, free_slot] = x
+        self.bullet_y[fights, free_slot] = y
+        self.bullet_dx[fights, free_slot] = forward_x
+        self.bullet_dy[fights, free_slot] = forward_y
+        self.bullet_owner[fights, free_slot] = slot
+        self.bullet_alive[fights, free_slot] = True
+        self.bullet_destroy[fights, free_slot] = False
+
+    def _grow_bullets(self):
+        capacity = self.bullet_alive.shape[1]
+        for name in ('bullet_x', 'bullet_y', 'bullet_dx', 'bullet_dy', 'bullet_owner', 'bullet_alive', 'bullet_destroy'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros((self.fights, capacity), dtype=array.dtype)], axis=1))
+
+    def _tick_bullets(self, delta_s):
+        # We destroy bullets that were marked as destroyed during the previous update
+        removed = self.bullet_alive & self.bullet_destroy
+        self.bullet_alive &= ~removed
+        self.bullet_destroy &= ~removed
+
+        alive = self.bullet_alive
+        self.bullet_x = np.where(alive, self.bullet_x + (self.bullet_dx * BULLET_SPEED * delta_s), self.bullet_x)
+        self.bullet_y = np.where(alive, self.bullet_y + (self.bullet_dy * BULLET_SPEED * delta_s), self.bullet_y)
+
+        # Out of bounds check
+        out_of_bounds = (self.bullet_x > self.size_x) | (self.bullet_x < 0) | (self.bullet_y > self.size_y) | (self.bullet_y < 0)
+        self.bullet_destroy |= alive & out_of_bounds
+
+    def _agent_record(self, fight, slot):
+        action_counter = {}
+        for action, name in enumerate(ACTION_NAMES):
+            count = int(self.action_counts[fight, slot, action])
+            if count > 0:
+                action_counter[name] = action_counter.get(name, 0) + count
+
+        return AgentRecord(
+            action_counter,
+            int(self.bullets_taken[fight, slot]),
+            int(self.successful_shots[fight, slot]),
+            int(self.shots_during_reloading[fight, slot]),
+            int(self.shots_while_enemy_in_fov[fight, slot]),
+            int(self.close_to_corner[fight, slot]),
+            int(self.close_to_border[fight, slot]),
+            int(self.most_repeated_action[fight, slot]),
+            int(self.most_repeated_counter[fight, slot]),
+            int(self.is_enemy_in_fov[fight, slot]),
+            int(self.enemy_is_close[fight, slot]))
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import queue
+import logging
+import importlib
+import threading
+
+import numpy as np
+
+logger = logging.getLogger()
+
+CHECKPOINT_FORMAT = 'genetics-checkpoint'
+# Raised whenever the header or the arrays change in a way older code can not read
+CHECKPOINT_VERSION = 1
+# Writes CheckpointWriter keeps waiting besides the one it runs - the generation and the best creature of a checkpoint
+MAX_PENDING_WRITES = 2
+
+
+def is_checkpoint(path):
+    '''
+        Checkpoints start with their JSON header, the generations serialized before them are pickles.
+    '''
+    with open(path, 'rb') as binary_file:
+        return binary_file.read(1) == b'{'
+
+
+def mapper_name(mapper, value):
+    '''
+        The name value is registered under in one of the mappers, so a checkpoint does not depend on where the classes live.
+    '''
+    for name, registered in mapper.mapper.items():
+        if registered is value:
+            return name
+
+    raise ValueError(f'{value} is not registered in {mapper.__name__}')
+
+
+def function_name(func):
+    return f'{func.__module__}:{func.__qualname__}'
+
+
+def import_function(name):
+    module, qualname = name.split(':')
+    func = importlib.import_module(module)
+    for attribute in qualname.split('.'):
+        func = getattr(func, attribute)
+
+    return func
+
+
+def random_state_to_json(state):
+    bit_generator, keys, position, has_gauss, cached_gaussian = state
+
+    return {'bit_generator': bit_generator, 'keys': keys.tolist(), 'position': int(position),
+            'has_gauss': int(has_gauss), 'cached_gaussian': float(cached_gaussian)}
+
+
+def random_state_from_json(state):
+    return (state['bit_generator'], np.array(state['keys'], dtype=np.uint32), state['position'],
+            state['has_gauss'], state['cached_gaussian'])
+
+
+def write_checkpoint(path, header, genomes):
+    '''
+        Writes the genomes to a raw .npy file next to path and the header to path itself.
+        The genomes file is named after the generation, so a crash between the two writes leaves the previous header
+        pointing to its own genomes. Both files are written under a temporary name and renamed once complete.
+    '''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    previous_genomes = _genomes_file(path) if os.path.exists(path) else None
+
+    genomes_file = f'{os.path.basename(path)}.{header["generation"]}.npy'
+    genomes_path = os.path.join(directory, genomes_file)
+    with open(genomes_path + '.tmp', 'wb') as binary_file:
+        np.save(binary_file, np.ascontiguousarray(genomes))
+        binary_file.flush()
+        os.fsync(binary_file.fileno())
+    os.replace(genomes_path + '.tmp', genomes_path)
+
+    header = dict(header, format=CHECKPOINT_FORMAT, version=CHECKPOINT_VERSION,
+                  genomes={'file': genomes_file, 'dtype': str(genomes.dtype), 'shape': list(genomes.shape)})
+    with open(path + '.tmp', 'w') as text_file:
+        json.dump(header, text_file, indent=4)
+        text_file.flush()
+        os.fsync(text_file.fileno())
+    os.replace(path + '.tmp', path)
+
+    if previous_genomes is not None and previous_genomes != genomes_file:
+        try:
+            os.remove(os.path.join(directory, previous_genomes))
+        except OSError as error:
+            # A file still mapped by this process can not be removed on some systems, it is removed by a later checkpoint
+            logger.debug(f'The genomes of the previous checkpoint are kept: {error}')
+
+
+def read_header(path):
+    '''
+        Returns only the JSON header of the checkpoint in path, the genomes file is not needed for it.
+    '''
+    with open(path, 'r') as text_file:
+        header = json.load(text_file)
+
+    if header.get('format') != CHECKPOINT_FORMAT:
+        raise ValueError(f'{path} is not a checkpoint')
+    if header['version'] > CHECKPOINT_VERSION:
+        raise ValueError(f'{path} is a checkpoint of version {header["version"]}, only {CHECKPOINT_VERSION} and older can be read')
+
+    return header
+
+
+def read_checkpoint(path, mmap_mode='c'):
+    '''
+        Returns the header and the genomes of the checkpoint in path.
+        mmap_mode - how the genomes file is mapped to memory, see numpy.load. With the default copy-on-write mapping
+        the genomes are only read from the disk when they are used and changing them does not change the file.
+        None reads the whole file.
+    '''
+    header = read_header(path)
+    genomes = np.load(os.path.join(os.path.dirname(path), header['genomes']['file']), mmap_mode=mmap_mode)
+    if list(genomes.shape) != header['genomes']['shape']:
+        raise ValueError(f'The genomes of {path} have shape {genomes.shape} instead of {header["genomes"]["shape"]}')
+
+    return header, genomes
+
+
+def _genomes_file(path):
+    try:
+        with open(path, 'r') as text_file:
+            return json.load(text_file)['genomes']['file']
+    except (ValueError, KeyError, UnicodeDecodeError):
+        # A pickled generation has no genomes file of its own
+        return None
+
+
+class CheckpointWriter:
+    def __init__(self):
+        '''
+            Writes checkpoints on a background thread, so the training goes on while they are written.
+            What is submitted has to be a copy which the training does not change anymore.
+            The writes run one after another. When MAX_PENDING_WRITES are already waiting submit waits as well,
+            so the checkpoints never pile up in memory when the disk is slower than the training.
+        '''
+        self._writes = queue.Queue(maxsize=MAX_PENDING_WRITES)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, path, write):
+        '''
+            write - function which writes the checkpoint to path, it runs on the background thread.
+        '''
+        start = time.perf_counter()
+        self._writes.put((path, write))
+        waited = time.perf_counter() - start
+        if waited > 0.1:
+            logger.info(f'Waited {waited:.2f}s for the previous checkpoints to be written before {path}')
+
+    def flush(self):
+        '''
+            Waits until everything submitted is written.
+        '''
+        self._writes.join()
+
+    def close(self):
+        self.flush()
+        self._writes.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            task = self._writes.get()
+            if task is None:
+                self._writes.task_done()
+                break
+
+            path, write = task
+            try:
+                write()
+            except Exception:
+                # A failed checkpoint does not stop the training, the next one is written as usual
+                logger.exception(f'Writing the checkpoint {path} failed')
+            finally:
+                self._writes.task_done()
@@ -0,0 +1,70 @@
+import numpy as np
+
+from .genome import GenomeMatrix
+from .mutation import SingleWeightPerNodeMutation
+
+# How many times the clones are mutated again when a mutant happens to be a clone as well
+MAX_MUTATION_ATTEMPTS = 10
+
+
+class ClonePolicyMapper:
+    mapper = {}
+
+    def __init__(self, policy_type):
+        self.policy_type = policy_type
+
+    def __call__(self, policy_class):
+        ClonePolicyMapper.mapper[self.policy_type] = policy_class
+
+        return policy_class
+
+    @classmethod
+    def get_clone_policy(self, policy_type):
+        return self.mapper[policy_type]
+
+
+class ClonePolicy:
+    def handle(self, genomes: GenomeMatrix, originals):
+        '''
+            originals - for every creature the index of the first creature with the same genome.
+            Returns for every creature the index of the creature whose evaluation it takes.
+        '''
+        raise NotImplementedError()
+
+
+@ClonePolicyMapper("keep")
+class KeepClones(ClonePolicy):
+    '''
+        Every clone is evaluated on its own.
+    '''
+    def handle(self, genomes: GenomeMatrix, originals):
+        return np.arange(len(genomes))
+
+
+@ClonePolicyMapper("share")
+class ShareScore(ClonePolicy):
+    '''
+        Only the first creature with a genome is evaluated, its clones take its score.
+    '''
+    def handle(self, genomes: GenomeMatrix, originals):
+        return originals
+
+
+@ClonePolicyMapper("mutate")
+class MutateClones(ClonePolicy):
+    '''
+        Every clone is replaced by a mutant of itself - one random weight of every node and of every bias is regenerated.
+    '''
+    def handle(self, genomes: GenomeMatrix, originals):
+        mutation = SingleWeightPerNodeMutation(1.0)
+        for _ in range(MAX_MUTATION_ATTEMPTS):
+            clones = np.flatnonzero(originals != np.arange(len(genomes)))
+            if len(clones) == 0:
+                break
+
+            mutants = genomes.take(clones)
+            mutation.mutate_population(mutants)
+            genomes.data[clones] = mutants.data
+            originals = genomes.originals()
+
+        return np.arange(len(genomes))
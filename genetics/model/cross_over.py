@@ -24,6 +24,14 @@ class CrossOver:
     def perform(self, arr1, arr2):
         raise NotImplementedError()
 
+    def perform_population(self, parents1, parents2, layout):
+        '''
+            Performs the cross over for many pairs of flat genomes at once.
+            Row i of parents1 is crossed with row i of parents2 and every segment of the layout is crossed on its own,
+            the same way perform is called for every node row and bias separately.
+        '''
+        raise NotImplementedError()
+
 
 @CrossOverMapper("two_points")
 class TwoPointsCrossOver(CrossOver):
@@ -33,18 +41,26 @@ class TwoPointsCrossOver(CrossOver):
     def perform(self, arr1, arr2):
         points = np.sort(np.random.choice(len(arr1), 2, replace=False))
 
-        child1 = []
-        child2 = []
+        child1 = np.array(arr1)
+        child2 = np.array(arr2)
+        child1[points[0] + 1:points[1]] = arr2[points[0] + 1:points[1]]
+        child2[points[0] + 1:points[1]] = arr1[points[0] + 1:points[1]]
+
+        return child1, child2
 
-        child1.extend(arr1[0:points[0] + 1])
-        child1.extend(arr2[points[0] + 1:points[1]])
-        child1.extend(arr1[points[1]:])
+    def perform_population(self, parents1, parents2, layout):
+        # Two different points per pair and segment, the elements strictly between them are swapped
+        lengths = layout.segment_lengths
+        first = np.random.randint(0, lengths, size=(len(parents1), len(lengths)))
+        second = np.random.randint(0, lengths - 1, size=(len(parents1), len(lengths)))
+        second += second >= first
+        low = np.minimum(first, second)
+        high = np.maximum(first, second)
 
-        child2.extend(arr2[0:points[0] + 1])
-        child2.extend(arr1[points[0] + 1:points[1]])
-        child2.extend(arr2[points[1]:])
+        positions = layout.segment_positions
+        swapped = (positions > low[:, layout.segment_ids]) & (positions < high[:, layout.segment_ids])
 
-        return np.array(child1), np.array(child2)
+        return np.where(swapped, parents2, parents1), np.where(swapped, parents1, parents2)
 
 
 @CrossOverMapper("arithmetic")
@@ -58,3 +74,11 @@ class ArithmeticCrossOver(CrossOver):
         child2 = (1 - a) * arr1 + a * arr2
 
         return child1, child2
+
+    def perform_population(self, parents1, parents2, layout):
+        # One coefficient per pair and segment
+        a = np.random.uniform(size=(len(parents1), len(layout.segment_lengths)))[:, layout.segment_ids]
+        child1 = a * parents1 + (1 - a) * parents2
+        child2 = (1 - a) * parents1 + a * parents2
+
+        return child1, child2
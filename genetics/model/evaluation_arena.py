@@ -1,5 +1,6 @@
 import math
 import time
+import numpy as np
 from genetics.world import World
 from genetics.geom import Vec2
 from genetics.model.neuralnet import NeuralNetwork
@@ -8,34 +9,84 @@ from genetics.actions import ShootAction, RotateAction,  MoveAction
 
 
 from .agent_metrics import AgentMetrics
+from .action_selection import ProbabilityActionSelection, fight_generators
+from .termination import FightProgress, TERMINATION_CHECK_INTERVAL, finished_fights
 
 
 class EvaluationArena:
-    def __init__(self, nn1: NeuralNetwork, nn2: NeuralNetwork):
+    def __init__(self, nn1: NeuralNetwork, nn2: NeuralNetwork, action_selection=ProbabilityActionSelection, decision_interval=1,
+                 terminations=(), seed=None):
+        '''
+            terminations - Termination classes, the fight stops as soon as one of them says it is finished.
+            They are checked every TERMINATION_CHECK_INTERVAL frames.
+            seed - the seed of the random generator of the fight. The same networks with the same seed always play the same fight,
+            the same one BatchedEvaluationArena plays with that seed.
+        '''
         super().__init__()
         self.world = World(Vec2(300, 100), Vec2(500, 500), False)
+        # Both agents take their start angles and their actions from the random generator of the fight
+        generators = fight_generators(1, None if seed is None else [seed])
+        self.action_selection = action_selection(generators)
 
         self.nn1 = nn1
         self.nn2 = nn2
-        self.agent1 = Agent(self.world, Vec2(50, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn1, (91, 108, 207))
-        self.agent2 = Agent(self.world, Vec2(450, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn2, (216, 43, 83))
+        self.agent1 = Agent(self.world, Vec2(50, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn1, (91, 108, 207),
+                            self.action_selection, decision_interval, generators[0])
+        self.agent2 = Agent(self.world, Vec2(450, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn2, (216, 43, 83),
+                            self.action_selection, decision_interval, generators[0])
         self.world.add_entity(self.agent1)
         self.world.add_entity(self.agent2)
         self.world.set_main_agent(self.agent1)
 
+        self.terminations = [termination() for termination in terminations]
+        self.frames_played = 0
+        self.last_shot_frame = 0
+        self.corner_streak = [0, 0]
+
     def update(self, delta_ms: float):
         self.world.update(delta_ms)
 
     def perform_fight(self, frames):
+        '''
+            Returns the metrics of both agents. When the fight is stopped early the metrics are computed over the frames played.
+        '''
         dt_60_fps = 1 / 60
         dt_60_fps *= 1.5
 
+        agents = (self.agent1, self.agent2)
+        fired = 0
+        close_to_corner = [0, 0]
+
         tick = 0
         while tick < frames:
             self.update(dt_60_fps)
             tick += 1
 
-        agent1_metrics = AgentMetrics(self.agent1, frames)
-        agent2_metrics = AgentMetrics(self.agent2, frames)
+            if not self.terminations:
+                continue
+
+            # Follow what the termination predicates need, the same way BatchedEvaluationArena does it
+            fired_now = sum(agent.action_counter.get("ShootAction", 0) - agent.shots_during_reloading for agent in agents)
+            if fired_now != fired:
+                fired = fired_now
+                self.last_shot_frame = tick
+            for slot, agent in enumerate(agents):
+                self.corner_streak[slot] = self.corner_streak[slot] + 1 if agent.close_to_corner != close_to_corner[slot] else 0
+                close_to_corner[slot] = agent.close_to_corner
+
+            if tick % TERMINATION_CHECK_INTERVAL == 0 and tick < frames:
+                if finished_fights(self.terminations, self._progress(tick, frames, dt_60_fps))[0]:
+                    break
+
+        self.frames_played = tick
+        agent1_metrics = AgentMetrics(self.agent1, tick)
+        agent2_metrics = AgentMetrics(self.agent2, tick)
 
         return agent1_metrics, agent2_metrics
+
+    def _progress(self, tick, frames, delta_s):
+        return FightProgress(tick, frames, (frames - tick) * delta_s,
+                             np.array([self.last_shot_frame]),
+                             np.array([len(self.world.bullets)]),
+                             np.array([self.corner_streak]),
+                             np.array([[self.agent1.successful_shots, self.agent2.successful_shots]]))
@@ -0,0 +1,379 @@
+import multiprocessing
+import traceback
+import logging
+import time
+import math
+
+import numpy as np
+
+from collections import deque
+from multiprocessing import resource_tracker, connection
+from tqdm import tqdm
+
+
+logger = logging.getLogger()
+
+# A task should be short enough that the last tasks of a generation do not keep a single worker busy while the others wait
+MAX_TASK_SECONDS = 10.0
+# How many tasks every worker has waiting in the queue, so it never waits for the main process
+TASKS_IN_FLIGHT_PER_WORKER = 2
+# Number of recent chunks the latency is estimated from
+LATENCY_HISTORY = 64
+# How often the supervisor checks the workers and the deadlines while it waits for results
+SUPERVISION_INTERVAL = 1.0
+# How many times an item is tried before it is given up. After the first failure it is tried in a chunk of its own
+MAX_ATTEMPTS = 2
+
+TASK_STARTED = 'started'
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'
+
+
+def worker_loop(worker_id, task_queue: multiprocessing.Queue, results, task_func, task_args):
+    # Forked workers start with the RNG state of the parent, so every worker gets its own seed
+    np.random.seed()
+
+    while True:
+        task = task_queue.get(block=True)
+
+        # None is the signal to stop
+        if task is None:
+            break
+
+        task_id, task = task
+        # The supervisor measures the deadline of a task from the moment it is taken.
+        # The messages are written to the pipe before the task runs, so they are not lost when the worker is killed during it
+        results.send((TASK_STARTED, worker_id, task_id, 0.0, None))
+        start = time.perf_counter()
+        try:
+            result = task_func(task, *task_args)
+        except Exception:
+            results.send((TASK_FAILED, worker_id, task_id, time.perf_counter() - start, traceback.format_exc()))
+            continue
+
+        results.send((TASK_DONE, worker_id, task_id, time.perf_counter() - start, result))
+
+
+class Evaluation:
+    def __init__(self, items, report, on_results=None):
+        '''
+            The state of one PopulationEvaluator.evaluate call. waiting holds the indices of the items which still have to be handed out,
+            in_flight maps the id of every task given to a worker to its Task.
+        '''
+        self.items = items
+        self.report = report
+        self.results = []
+        self.on_results = on_results
+        self.waiting = deque(range(len(items)))
+        self.attempts = [0] * len(items)
+        self.in_flight = {}
+        self.progress = None
+
+    def next_chunk(self, chunk_size):
+        '''
+            Items which failed before are tried on their own, so they can not take other items down with them
+            and other items can not be charged to them.
+        '''
+        if self.attempts[self.waiting[0]] > 0:
+            return [self.waiting.popleft()]
+
+        chunk = []
+        while self.waiting and len(chunk) < chunk_size and self.attempts[self.waiting[0]] == 0:
+            chunk.append(self.waiting.popleft())
+
+        return chunk
+
+    def retry(self, chunk, reason):
+        for idx in chunk:
+            self.attempts[idx] += 1
+            if self.attempts[idx] < MAX_ATTEMPTS:
+                self.waiting.appendleft(idx)
+            else:
+                self.report.failures.append((self.items[idx], reason))
+                self.progress.update(1)
+
+
+class Task:
+    def __init__(self, worker_id, items):
+        '''
+            A chunk handed to a worker. items are the indices of its items, started is set when the worker takes it.
+        '''
+        self.worker_id = worker_id
+        self.items = items
+        self.started = None
+
+
+class LatencyModel:
+    def __init__(self, history=LATENCY_HISTORY):
+        '''
+            Estimates the time of a chunk as overhead + items * per_item from the recent chunks.
+            The overhead is the part which does not depend on the chunk size, like setting up a batch of fights.
+        '''
+        self.samples = deque(maxlen=history)
+        self.overhead = 0.0
+        self.per_item = None
+
+    def add(self, items, seconds):
+        if items == 0:
+            return
+
+        self.samples.append((items, seconds))
+        sizes = np.array([size for size, _ in self.samples], dtype=np.float64)
+        times = np.array([seconds for _, seconds in self.samples], dtype=np.float64)
+
+        # The overhead can only be separated once chunks of different sizes were measured
+        if len(np.unique(sizes)) > 1:
+            per_item, overhead = np.polyfit(sizes, times, 1)
+            if per_item > 0:
+                self.per_item = per_item
+                self.overhead = max(overhead, 0.0)
+                return
+
+        if self.per_item is None:
+            self.per_item = times.sum() / sizes.sum()
+
+
+class UtilizationReport:
+    def __init__(self, number_of_processes):
+        '''
+            How busy the workers were during one evaluation.
+        '''
+        self.busy_time = [0.0] * number_of_processes
+        self.items = [0] * number_of_processes
+        self.chunks = 0
+        self.wall_time = 0.0
+        self.restarts = 0
+        # (item, reason) for every item which failed MAX_ATTEMPTS times
+        self.failures = []
+
+    def add(self, worker_id, busy_time, items):
+        self.busy_time[worker_id] += busy_time
+        self.items[worker_id] += items
+        self.chunks += 1
+
+    @property
+    def utilization(self):
+        if self.wall_time == 0:
+            return 0.0
+
+        return sum(self.busy_time) / (self.wall_time * len(self.busy_time))
+
+    def __str__(self):
+        per_worker = ', '.join(f'{busy / self.wall_time:.0%} ({items})' if self.wall_time > 0 else f'0% ({items})'
+                               for busy, items in zip(self.busy_time, self.items))
+
+        report = f'Workers were busy {self.utilization:.0%} of {self.wall_time:.2f}s in {self.chunks} chunks, ' \
+                 f'per worker: {per_worker}'
+        if self.restarts > 0 or self.failures:
+            report += f', {self.restarts} workers restarted, {len(self.failures)} items failed'
+
+        return report
+
+
+class PopulationEvaluator:
+    def __init__(self, number_of_processes, task_func, task_args=(), item_deadline=None):
+        '''
+            Long-lived pool of evaluation processes which survives across generations.
+            Every (task id, task) put in the task queue of a worker is handled by task_func(task, *task_args) inside it.
+            The workers report through their own pipe when they take a task and send its value or the exception it raised.
+            While waiting for the results the pool supervises the workers - a worker which died is started again
+            and a task running longer than item_deadline seconds per item has its worker killed.
+            The items of such tasks are tried again, the ones which keep failing are reported as failures.
+        '''
+        self.number_of_processes = number_of_processes
+        self.task_func = task_func
+        self.task_args = task_args
+        self.item_deadline = item_deadline
+        self.task_queues = [None] * number_of_processes
+        self.connections = [None] * number_of_processes
+        self.processes = [None] * number_of_processes
+        self.latency = LatencyModel()
+        self.last_report = None
+
+    @property
+    def is_running(self):
+        return all(process is not None and process.is_alive() for process in self.processes)
+
+    def start(self):
+        # The workers have to share the resource tracker of this process, see SharedGenomeReader.attach
+        resource_tracker.ensure_running()
+
+        for worker_id in range(self.number_of_processes):
+            self._start_worker(worker_id)
+
+        logger.info(f'Evaluation pool with {self.number_of_processes} processes started')
+
+    def _start_worker(self, worker_id):
+        # A new queue, so nothing meant for a dead worker is left in it
+        self.task_queues[worker_id] = multiprocessing.Queue()
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=worker_loop,
+                                          args=(worker_id, self.task_queues[worker_id], sender, self.task_func, self.task_args))
+        process.daemon = True
+        process.start()
+        # Only the worker keeps the sending end open, so its pipe reports the end of file once it is gone
+        sender.close()
+        self.processes[worker_id] = process
+        self.connections[worker_id] = receiver
+
+    def submit(self, worker_id, task_id, task):
+        self.task_queues[worker_id].put((task_id, task))
+
+    def get_result(self, timeout=None):
+        '''
+            Returns the next message of any worker, or None when nothing came in timeout seconds or a worker stopped.
+        '''
+        ready = connection.wait(self.connections, timeout)
+        if not ready:
+            return None
+
+        try:
+            return ready[0].recv()
+        except (EOFError, OSError):
+            return None
+
+    def evaluate(self, items, make_task, on_results=None):
+        '''
+            Hands out the items to the workers in chunks. Every chunk becomes one task through make_task(chunk),
+            the task function has to return a list of results for it. Whichever worker has the fewest tasks gets the next chunk,
+            so the workers stay busy until the end. Returns the results of all chunks in the order they finished.
+            The items which could not be evaluated are in the failures of last_report.
+            on_results - called with the results of every chunk as soon as it finishes.
+        '''
+        evaluation = Evaluation(items, UtilizationReport(self.number_of_processes), on_results)
+        next_task_id = 0
+        start = time.perf_counter()
+        supervised = start
+
+        with tqdm(total=len(items)) as evaluation.progress:
+            while evaluation.waiting or evaluation.in_flight:
+                while evaluation.waiting and len(evaluation.in_flight) < TASKS_IN_FLIGHT_PER_WORKER * self.number_of_processes:
+                    chunk = evaluation.next_chunk(self._chunk_size(len(evaluation.waiting), len(items)))
+                    worker_id = self._least_busy_worker(evaluation.in_flight)
+
+                    self.submit(worker_id, next_task_id, make_task([items[idx] for idx in chunk]))
+                    evaluation.in_flight[next_task_id] = Task(worker_id, chunk)
+                    next_task_id += 1
+
+                message = self.get_result(SUPERVISION_INTERVAL)
+                if message is not None:
+                    self._handle(evaluation, message)
+
+                if message is None or time.perf_counter() - supervised >= SUPERVISION_INTERVAL:
+                    self._supervise(evaluation)
+                    supervised = time.perf_counter()
+
+        evaluation.report.wall_time = time.perf_counter() - start
+        self.last_report = evaluation.report
+        logger.info(str(evaluation.report))
+
+        return evaluation.results
+
+    def _handle(self, evaluation, message):
+        kind, worker_id, task_id, busy_time, value = message
+
+        # A task handed out again by the supervisor can still report from the worker which was stopped
+        task = evaluation.in_flight.get(task_id)
+        if task is None or task.worker_id != worker_id:
+            return
+
+        if kind == TASK_STARTED:
+            task.started = time.perf_counter()
+            return
+
+        del evaluation.in_flight[task_id]
+        evaluation.report.add(worker_id, busy_time, len(task.items))
+        if kind == TASK_DONE:
+            self.latency.add(len(task.items), busy_time)
+            evaluation.results.extend(value)
+            if evaluation.on_results is not None:
+                evaluation.on_results(value)
+            evaluation.progress.update(len(task.items))
+        else:
+            logger.error(f'Evaluation of {len(task.items)} items failed:\n{value}')
+            evaluation.retry(task.items, 'exception')
+
+    def _least_busy_worker(self, in_flight):
+        tasks = [0] * self.number_of_processes
+        for task in in_flight.values():
+            tasks[task.worker_id] += 1
+
+        return int(np.argmin(tasks))
+
+    def _supervise(self, evaluation):
+        '''
+            Restarts the workers which died or ran over the deadline of their task. The task they were running is tried again
+            with one more attempt counted for its items, the tasks still waiting in their queue go back to the front of the line.
+        '''
+        now = time.perf_counter()
+        for worker_id, process in enumerate(self.processes):
+            started = [task for task in evaluation.in_flight.values() if task.worker_id == worker_id and task.started is not None]
+
+            if not process.is_alive():
+                reason = f'worker exited with code {process.exitcode}'
+            elif self.item_deadline is not None and \
+                    any(now - task.started > self.item_deadline * len(task.items) for task in started):
+                reason = f'deadline of {self.item_deadline}s per item exceeded'
+                process.kill()
+            else:
+                continue
+
+            process.join()
+            # Whatever the worker managed to report before it stopped is taken first, so finished tasks are not repeated
+            try:
+                while self.connections[worker_id].poll():
+                    self._handle(evaluation, self.connections[worker_id].recv())
+            except (EOFError, OSError):
+                pass
+            self.connections[worker_id].close()
+
+            # A worker takes its tasks in the order they were submitted, so the oldest one left is the one it was running.
+            # The message that it started is not relied on, the worker could have been killed before sending it.
+            task_ids = sorted(task_id for task_id, task in evaluation.in_flight.items() if task.worker_id == worker_id)
+            logger.warning(f'Evaluation process {process.pid} stopped: {reason}, {len(task_ids)} tasks are handed out again')
+            for position, task_id in enumerate(task_ids):
+                task = evaluation.in_flight.pop(task_id)
+                if position == 0:
+                    evaluation.retry(task.items, reason)
+                else:
+                    evaluation.waiting.extendleft(reversed(task.items))
+
+            self._start_worker(worker_id)
+            evaluation.report.restarts += 1
+
+    def _chunk_size(self, remaining, total):
+        '''
+            Guided scheduling - the chunks shrink with the amount of remaining work, so the last ones finish close together.
+            The measured latency stops them from shrinking below the size where the fixed cost of a chunk is as large
+            as its work - unless that would leave some workers without any - and from growing above MAX_TASK_SECONDS.
+        '''
+        chunk_size = math.ceil(remaining / (TASKS_IN_FLIGHT_PER_WORKER * self.number_of_processes))
+
+        per_item = self.latency.per_item
+        if per_item is not None:
+            min_size = min(math.ceil(self.latency.overhead / per_item), math.ceil(total / self.number_of_processes))
+            max_size = max(min_size, int(MAX_TASK_SECONDS / per_item))
+            chunk_size = min(max(chunk_size, min_size), max_size)
+
+        return max(1, min(chunk_size, remaining))
+
+    def shutdown(self, timeout=10):
+        if not any(process is not None for process in self.processes):
+            return
+
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f'Evaluation process {process.pid} did not stop in {timeout}s, terminating it')
+                process.terminate()
+                process.join()
+
+        for receiver in self.connections:
+            receiver.close()
+
+        self.processes = [None] * self.number_of_processes
+        self.connections = [None] * self.number_of_processes
+        logger.info('Evaluation pool stopped')
@@ -0,0 +1,78 @@
+import os
+import pickle
+import struct
+import hashlib
+import logging
+from collections import OrderedDict
+
+from .utils import pickle_serialization
+
+logger = logging.getLogger()
+
+
+def fight_seed(run_seed, first_hash, second_hash, repeat):
+    '''
+        The seed of a fight between two genomes. repeat tells apart the fights the same two genomes have in one generation.
+        The same genomes meeting again in a later generation of the run get the same seeds, so their fights can come from a FightCache.
+    '''
+    digest = hashlib.blake2b(struct.pack('<QQQQ', run_seed, first_hash, second_hash, repeat), digest_size=8).digest()
+
+    return int.from_bytes(digest, 'little')
+
+
+class FightCache:
+    def __init__(self, max_size, path=None, settings=None):
+        '''
+            Least recently used cache of fight outcomes - (first_hash, second_hash, seed, side) -> (first_metrics, second_metrics).
+            A seeded fight between the same genomes always ends the same way, so it does not have to be simulated again.
+            path - optional file the cache is kept in between runs.
+            settings - everything besides the genomes and the seed that changes a fight. A stored cache is only used with the same settings.
+        '''
+        self.max_size = max_size
+        self.path = path
+        self.settings = settings
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        outcome = self.entries.get(key)
+        if outcome is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return outcome
+
+    def put(self, key, outcome):
+        self.entries[key] = outcome
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb') as binary_file:
+            settings, entries = pickle.load(binary_file)
+
+        if settings != self.settings:
+            logger.info(f'The fight cache in {self.path} was made with other settings and is not used')
+            return
+
+        for key, outcome in entries:
+            self.put(key, outcome)
+
+    def save(self):
+        if self.path:
+            pickle_serialization((self.settings, list(self.entries.items())), self.path)
@@ -1,13 +1,25 @@
-import multiprocessing
+import math
 import pickle
 import logging
 
 import numpy as np
 
-from tqdm import tqdm
-from .evaluation_arena import EvaluationArena
-from .neuralnet import NeuralNetwork
-from .utils import pickle_serialization
+from .batched_arena import BatchedEvaluationArena
+from .neuralnet import NeuralNetwork, NeuralNetworkBatch
+from .genome import GenomeLayout, GenomeMatrix, SharedGenomeMatrix, SharedGenomeReader
+from .evaluator import PopulationEvaluator
+from .action_selection import ProbabilityActionSelection
+from .fight_cache import FightCache, fight_seed
+from .fitness_func import fitness_func
+from .journal import EvaluationJournal
+from .clones import KeepClones, ClonePolicyMapper
+from .activation_function import FunctionMapper
+from .selection import SelectionMapper
+from .mutation import MutationMapper
+from .cross_over import CrossOverMapper
+from .action_selection import ActionSelectionMapper
+from .termination import TerminationMapper
+from . import checkpoint
 
 NUMBER_OF_FRAMES = 1800
 NUMBER_OF_FIGHTS_PER_CREATURE = 5
@@ -16,41 +28,77 @@ logging.basicConfig(format='[%(levelname)s] %(asctime)s: %(message)s', level=log
 logger = logging.getLogger()
 
 
-def process_func(pairs, results_queue: multiprocessing.Queue, fitness_func):
-    for pair in pairs:
-        net = pair[0]
-        enemies = pair[1]
+# Every evaluation process maps the genomes of the current generation once and keeps them until the next one
+shared_genomes = SharedGenomeReader()
 
-        scores = []
-        for enemy in enemies:
-            try:
-                fight_score = perform_fight(net, enemy, fitness_func)
-                scores.append(fight_score)
-            except Exception as error:
-                logger.exception('Exception')
-                print(f'Error happened while simulating the arena: {error}')
 
-        final_score = sum(scores)
-        results_queue.put((net, final_score))
+def process_func(task, activation_func, action_selection, decision_interval, terminations):
+    genomes_descriptor, fights = task
+    genomes = shared_genomes.attach(genomes_descriptor)
 
+    first_nets = [first_idx for first_idx, _, _, _ in fights]
+    second_nets = [second_idx for _, second_idx, _, _ in fights]
+    seeds = [seed for _, _, seed, _ in fights]
+    sides = [side for _, _, _, side in fights]
+
+    # An exception is not caught here - the evaluator tries the fights again and reports the ones which keep failing
+    metrics = simulate_fights(genomes, first_nets, second_nets, activation_func, action_selection, decision_interval, terminations,
+                              seeds, sides)
+
+    # The metrics of both participants are sent back, the scores are computed from them by the main process
+    return [(fight, first_metrics, second_metrics) for fight, (first_metrics, second_metrics) in zip(fights, metrics)]
+
+
+def simulate_fights(genomes: GenomeMatrix, first_nets, second_nets, activation_func, action_selection=ProbabilityActionSelection,
+                    decision_interval=1, terminations=(), seeds=None, sides=None):
+    '''
+        Simulates all fights together in a BatchedEvaluationArena. The nets are given as indices of the genome matrix.
+        sides - 0 when the first net of the fight starts on the left, 1 when it starts on the right. Random when not given.
+        Returns the metrics of the first and the second net of every fight in the order they were given.
+    '''
+    first_nets = np.asarray(first_nets, dtype=np.int64)
+    second_nets = np.asarray(second_nets, dtype=np.int64)
 
-def perform_fight(net_to_evaluate, enemy_net, fitness_func):
-    start_position = np.random.choice(2)
-    
     # The idea is to make the creature learn how to play from both sides
-    if start_position == 0:
-        arena = EvaluationArena(net_to_evaluate, enemy_net)
-        net_metrics, enemy_metrics = arena.perform_fight(NUMBER_OF_FRAMES)
-        return fitness_func(net_metrics, enemy_metrics)
+    start_positions = np.random.choice(2, len(first_nets)) if sides is None else np.asarray(sides, dtype=np.int64)
+    left_nets = np.where(start_positions == 0, first_nets, second_nets)
+    right_nets = np.where(start_positions == 0, second_nets, first_nets)
+
+    arena = BatchedEvaluationArena(NeuralNetworkBatch.from_genomes(genomes, left_nets, activation_func),
+                                   NeuralNetworkBatch.from_genomes(genomes, right_nets, activation_func),
+                                   action_selection, decision_interval, terminations, seeds)
+
+    metrics = []
+    for (left_metrics, right_metrics), start in zip(arena.perform_fight(NUMBER_OF_FRAMES), start_positions):
+        metrics.append((left_metrics, right_metrics) if start == 0 else (right_metrics, left_metrics))
 
-    arena = EvaluationArena(enemy_net, net_to_evaluate)
-    enemy_metrics, net_metrics = arena.perform_fight(NUMBER_OF_FRAMES)
-    return fitness_func(net_metrics, enemy_metrics)
+    return metrics
+
+
+def perform_fights(genomes: GenomeMatrix, first_nets, second_nets, fitness_func, activation_func,
+                   action_selection=ProbabilityActionSelection, decision_interval=1, terminations=()):
+    '''
+        Scores both nets of every fight simulated together by simulate_fights.
+        Returns the scores of the first and of the second nets in the order they were given and the number of frames every fight lasted.
+    '''
+    first_scores = []
+    second_scores = []
+    frames_played = []
+    for first_metrics, second_metrics in simulate_fights(genomes, first_nets, second_nets, activation_func, action_selection,
+                                                         decision_interval, terminations):
+        first_scores.append(fitness_func(first_metrics, second_metrics))
+        second_scores.append(fitness_func(second_metrics, first_metrics))
+        frames_played.append(first_metrics.frames)
+
+    return first_scores, second_scores, frames_played
 
 
 class GeneticEvolution:
     def __init__(self, creator_tag, population_size, fitness_func,
-                 activation_func, selection_algorithm, selection_parent_rate, mutation_algorithm, mutation_rate, cross_over):
+                 activation_func, selection_algorithm, selection_parent_rate, mutation_algorithm, mutation_rate, cross_over, *,
+                 fights_per_creature=NUMBER_OF_FIGHTS_PER_CREATURE, action_selection=ProbabilityActionSelection, decision_interval=1,
+                 terminations=(), racing_survival_rate=1.0, fight_cache_size=0,
+                 fight_cache_file=None, clone_policy=KeepClones, seed=None, fight_deadline=None, evaluation_journal_file=None):
         self._generation = 1
         self._population_size = population_size if population_size % 2 == 0 else population_size + 1
         self.mutation_rate = mutation_rate
@@ -60,8 +108,64 @@ class GeneticEvolution:
         self.mutation_algorithm = mutation_algorithm
         self.generations_fitness = []
         self.is_evaluated = False
+        self.creator_tag = creator_tag
+        self.activation_func = activation_func
+        self.cross_over = cross_over
+        self.fights_per_creature = fights_per_creature
+        self.action_selection = action_selection
+        self.decision_interval = decision_interval
+        self.terminations = list(terminations)
+        self.racing_survival_rate = racing_survival_rate
+        self.fight_cache_size = fight_cache_size
+        self.fight_cache_file = fight_cache_file
+        self.clone_policy = clone_policy
+        # The seed of the run - the pairs and the fights of a generation depend only on it, the generation and the genomes
+        self.seed = seed if seed is not None else int(np.random.randint(0, 2 ** 32))
+        if seed is not None:
+            # The first population, the selection, the cross over and the mutation draw from the global numpy RNG,
+            # so a given seed repeats the whole run. Its state is stored with every checkpoint.
+            np.random.seed(seed)
+        # Wall clock seconds a worker gets for a fight before it is considered stuck
+        self.fight_deadline = fight_deadline
+        self.failed_fights = []
+        # (first_hash, second_hash, seed) of every fight the evaluation of the current generation played
+        self.evaluated_fights = []
+        # The outcomes of the fights are journaled there while the generation is evaluated, see resume_evaluation
+        self.evaluation_journal_file = evaluation_journal_file
+        self._journal_outcomes = {}
+        self._evaluator = None
+        self._fight_cache = None
+
+        layout = NeuralNetwork(creator_tag, activation_func, cross_over, False).layout
+        self._set_population(GenomeMatrix.random(layout, self._population_size), [0] * self._population_size)
 
-        self._population = [(NeuralNetwork(creator_tag, activation_func, cross_over), 0) for _ in range(self._population_size)]
+    @staticmethod
+    def from_config(config, fitness_func=fitness_func):
+        '''
+            Builds the genetic algorithm from the algorithms, serialization and arena sections of app_config.json.
+            config - the loaded configuration, genetics.config.Config.
+        '''
+        return GeneticEvolution(
+            config.get("arena.creature_name_tag"),
+            config.get("algorithms.population_size"),
+            fitness_func,
+            FunctionMapper.get_func(config.get("algorithms.activation_func")),
+            SelectionMapper.get_selection(config.get("algorithms.selection_type")),
+            config.get("algorithms.previous_generation_rate"),
+            MutationMapper.get_mutation(config.get("algorithms.mutation_type")),
+            config.get("algorithms.mutation_rate"),
+            CrossOverMapper.get_cross_over(config.get("algorithms.cross_over_type")),
+            fights_per_creature=config.get("algorithms.fights_per_creature"),
+            action_selection=ActionSelectionMapper.get_action_selection(config.get("algorithms.action_selection")),
+            decision_interval=config.get("algorithms.decision_interval"),
+            terminations=TerminationMapper.get_terminations(config.get("algorithms.early_termination")),
+            racing_survival_rate=config.get("algorithms.racing_survival_rate"),
+            fight_cache_size=config.get("algorithms.fight_cache_size"),
+            fight_cache_file=config.get("serialization.fight_cache_file"),
+            clone_policy=ClonePolicyMapper.get_clone_policy(config.get("algorithms.clone_policy")),
+            seed=config.get("algorithms.seed"),
+            fight_deadline=config.get("algorithms.fight_deadline_s"),
+            evaluation_journal_file=config.get("serialization.evaluation_journal_file"))
 
     @property
     def current_generation(self):
@@ -71,6 +175,10 @@ class GeneticEvolution:
     def best_network_so_far(self):
         return self._population[0][0]
 
+    @property
+    def genomes(self):
+        return self._genomes
+
     @property
     def top_fitness(self):
         return self._population[0][1]
@@ -85,66 +193,459 @@ class GeneticEvolution:
         return self._population[net_id][0]
 
     def evaluate_population(self, number_of_processes):
-        pairs = self._create_evaluation_pairs()
-        logger.info(f'{len(pairs)} pairs in total with {len(pairs) * NUMBER_OF_FIGHTS_PER_CREATURE} fights to evaluate')
-
-        batch_size = len(pairs) // number_of_processes
-        if batch_size * number_of_processes != len(pairs):
-            batch_size += 1
-        logger.info(f'Evaluating all agents with {batch_size} pairs per process')
-
-        results_queue = multiprocessing.Queue()
-        processes = []
-        for idx in range(number_of_processes):
-            batch_start = idx * batch_size
-            batch_end = min((idx + 1) * batch_size, len(pairs))
-            process_pairs = pairs[batch_start: batch_end]
-            logger.info(f'Process {idx} is taking pairs from {batch_start} to {batch_end - 1} inclusive')
-
-            process = multiprocessing.Process(target=process_func, args=(process_pairs, results_queue, self.fitness_func))
-            processes.append(process)
-            process.daemon = True
-            
-            process.start()
+        '''
+            Races the population - every round gives one more fight to the creatures still in the race and after it only the best
+            racing_survival_rate of them stay in. With a rate of 1 every creature gets all fights_per_creature fights in a single round.
+            The score of a creature is its mean score per fight scaled to fights_per_creature, so creatures with a different
+            number of fights are still ranked against each other. Clones are evaluated the way the clone policy says.
+        '''
+        nets_num = len(self._population)
+        evaluator = self._get_evaluator(number_of_processes)
+        originals = self._handle_clones()
+        creatures = np.flatnonzero(originals == np.arange(nets_num))
+        journal = self._start_journal()
+
+        scores = np.zeros(nets_num)
+        fights_count = np.zeros(nets_num, dtype=np.int64)
+        frames_played = []
+        # (fight, reason) for the fights the evaluator gave up on, they do not count for the scores of their creatures
+        self.failed_fights = []
+        self.evaluated_fights = []
+        racing = creatures
+        rounds = [self.fights_per_creature] if self.racing_survival_rate >= 1 else [1] * self.fights_per_creature
+
+        hashes = self._genomes.hashes()
+        repeats = {}
+        generator = np.random.default_rng([self.seed, self._generation])
+        cache = self._get_fight_cache()
+        if cache is not None:
+            cache.reset_stats()
+
+        # The genomes are published once, the tasks and the results only carry indices
+        shared = SharedGenomeMatrix(self._genomes)
+        try:
+            for round_idx, round_fights in enumerate(rounds):
+                if round_idx > 0:
+                    racing = self._race_survivors(racing, scores, fights_count)
+
+                pairs = self._create_evaluation_fights(creatures, racing, round_fights, generator)
+                fights = self._seed_fights(pairs, hashes, repeats)
+                self.evaluated_fights.extend(self._cache_key(fight, hashes)[:3] for fight in fights)
+                logger.info(f'{len(racing)} creatures with {len(fights)} fights to evaluate')
+
+                is_racing = np.zeros(nets_num, dtype=bool)
+                is_racing[racing] = True
+                for (first_idx, second_idx, _, _), first_metrics, second_metrics in self._simulate_fights(evaluator, shared, fights, hashes,
+                                                                                                         journal):
+                    first_score, second_score, frames = self._score_fight(first_metrics, second_metrics)
+                    # Only the creatures in the race are scored, their opponents already dropped out
+                    for net_idx, score in ((first_idx, first_score), (second_idx, second_score)):
+                        if is_racing[net_idx]:
+                            scores[net_idx] += score
+                            fights_count[net_idx] += 1
+                    frames_played.append(frames)
+
+            if journal is not None:
+                journal.finish()
+        finally:
+            shared.close()
+            if journal is not None:
+                journal.close()
+
+        if cache is not None:
+            logger.info(f'Fight cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} fights stored')
+        if len(rounds) > 1:
+            full_fights = (len(creatures) * self.fights_per_creature + 1) // 2
+            logger.info(f'Racing simulated {len(frames_played)} fights instead of {full_fights}')
+        if self.terminations:
+            self._log_frames_saved(frames_played)
+        if self.failed_fights:
+            logger.warning(f'{len(self.failed_fights)} fights failed, the creatures are scored by the rest of their fights')
+
+        per_fight = scores / np.maximum(fights_count, 1)
+        final_scores = np.where(fights_count == self.fights_per_creature, scores, per_fight * self.fights_per_creature)
+        # The clones which were not evaluated take the score of their original
+        final_scores = final_scores[originals].tolist()
+
+        order = sorted(range(nets_num), key=lambda idx: final_scores[idx], reverse=True)
+        self._set_population(self._genomes.take(order), [final_scores[idx] for idx in order])
+        self.generations_fitness.append(self._population[0][1])
+        self.is_evaluated = True
+        self._journal_outcomes = {}
+
+    def _handle_clones(self):
+        '''
+            Finds the creatures with the same weights as a creature before them and lets the clone policy deal with them.
+            Returns for every creature the index of the creature whose evaluation it takes.
+        '''
+        originals = self._genomes.originals()
+        clones = np.count_nonzero(originals != np.arange(len(originals)))
+        logger.info(f'{clones} of {len(originals)} creatures are clones ({clones / len(originals) * 100:.1f}%)')
+
+        originals = self.clone_policy().handle(self._genomes, originals)
+        # With less than two different genomes nobody would have an opponent, so everyone is evaluated
+        if np.count_nonzero(originals == np.arange(len(originals))) < 2:
+            originals = np.arange(len(originals))
+
+        return originals
+
+    def _simulate_fights(self, evaluator, shared, fights, hashes, journal=None):
+        '''
+            Takes the outcomes the journal of a resumed evaluation or the fight cache already know and simulates only the other fights.
+            The outcomes of the simulated fights are written to the journal as soon as they arrive.
+            Returns (fight, first_metrics, second_metrics) for every fight which did not fail.
+        '''
+        cache = self._fight_cache
 
         results = []
-        for _ in tqdm(range(len(self._population))):
-            net_and_score = results_queue.get(block=True, timeout=None)
-            results.append(net_and_score)  
-        results.sort(key=lambda x: x[1], reverse=True)
+        missing = []
+        for fight in fights:
+            key = self._cache_key(fight, hashes)
+            outcome = self._journal_outcomes.get(key)
+            if outcome is None and cache is not None:
+                outcome = cache.get(key)
+                if outcome is not None and journal is not None:
+                    journal.append({key: outcome})
+
+            if outcome is None:
+                missing.append(fight)
+            else:
+                results.append((fight, *outcome))
+
+        if missing:
+            for fight, first_metrics, second_metrics in self._evaluate_fights(evaluator, shared, missing, hashes, journal):
+                if cache is not None:
+                    cache.put(self._cache_key(fight, hashes), (first_metrics, second_metrics))
+                results.append((fight, first_metrics, second_metrics))
+
+        return results
+
+    def _evaluate_fights(self, evaluator, shared, fights, hashes, journal=None):
+        on_results = None
+        if journal is not None:
+            on_results = lambda chunk: journal.append({self._cache_key(fight, hashes): (first_metrics, second_metrics)
+                                                       for fight, first_metrics, second_metrics in chunk})
+
+        results = evaluator.evaluate(fights, lambda chunk: (shared.descriptor, chunk), on_results)
+        self.failed_fights.extend(evaluator.last_report.failures)
+
+        return results
+
+    def _score_fight(self, first_metrics, second_metrics):
+        return self.fitness_func(first_metrics, second_metrics), self.fitness_func(second_metrics, first_metrics), first_metrics.frames
+
+    def _seed_fights(self, pairs, hashes, repeats):
+        '''
+            Gives every fight a seed and a starting side which depend only on the seed of the run and the genomes of the two creatures.
+            repeats counts the fights every pair of genomes already had in the generation.
+        '''
+        fights = []
+        for first_idx, second_idx in pairs:
+            pair = (hashes[first_idx], hashes[second_idx])
+            repeat = repeats.get(pair, 0)
+            repeats[pair] = repeat + 1
+
+            seed = fight_seed(self.seed, *pair, repeat)
+            fights.append((first_idx, second_idx, seed, seed % 2))
+
+        return fights
 
-        self._population = results
-        self.generations_fitness.append(self._population[0][1])
-        self.is_evaluated = True
-    
-    def _create_evaluation_pairs(self):
-        nets = list(map(lambda pair: pair[0], self._population))
-        nets_num = len(self._population)
+    @staticmethod
+    def _cache_key(fight, hashes):
+        first_idx, second_idx, seed, side = fight
+
+        return hashes[first_idx], hashes[second_idx], seed, side
+
+    def _race_survivors(self, racing, scores, fights_count):
+        survivors = max(1, math.ceil(len(racing) * self.racing_survival_rate))
+        per_fight = scores[racing] / fights_count[racing]
+
+        return racing[np.argsort(-per_fight, kind='stable')[:survivors]]
+
+    def _log_frames_saved(self, frames_played):
+        stopped = sum(frames < NUMBER_OF_FRAMES for frames in frames_played)
+        saved = 1 - sum(frames_played) / (len(frames_played) * NUMBER_OF_FRAMES)
+        logger.info(f'{stopped} of {len(frames_played)} fights stopped early, {saved * 100:.1f}% of the frames were not played')
+
+    def _create_evaluation_fights(self, creatures, racing, rounds, generator):
+        '''
+            Builds the fights of a round of the race. Every fight is a pair of population indices and scores both of them.
+            creatures - the sorted indices of the creatures which are evaluated, racing - the ones of them still in the race.
+            While all of them race, each round pairs the creatures of a random permutation,
+            so every creature takes part in exactly one fight per round.
+            Later the creatures in the race fight random opponents from all creatures, so they do not only meet each other.
+        '''
+        nets_num = len(creatures)
+
+        fights = []
+        for _ in range(rounds):
+            if len(racing) < nets_num:
+                positions = np.searchsorted(creatures, racing)
+                opponents = creatures[(positions + generator.integers(1, nets_num, size=len(racing))) % nets_num]
+                fights.extend((int(net_idx), int(opponent)) for net_idx, opponent in zip(racing, opponents))
+                continue
+
+            permutation = creatures[generator.permutation(nets_num)]
+            fights.extend((int(permutation[idx]), int(permutation[idx + 1])) for idx in range(0, nets_num - 1, 2))
+
+            # With an odd number of creatures the last one of the round fights someone who already has a fight
+            if nets_num % 2 == 1 and nets_num > 1:
+                fights.append((int(permutation[-1]), int(permutation[generator.integers(nets_num - 1)])))
+
+        return fights
+
+    def _get_evaluator(self, number_of_processes):
+        '''
+            The evaluation processes are started once and reused by every following generation.
+        '''
+        evaluator = self._evaluator
+        if evaluator is None or evaluator.number_of_processes != number_of_processes or not evaluator.is_running:
+            self._stop_evaluator()
+            self._evaluator = PopulationEvaluator(number_of_processes, process_func,
+                                                  (self.activation_func, self.action_selection, self.decision_interval, self.terminations),
+                                                  self.fight_deadline)
+            self._evaluator.start()
+
+        return self._evaluator
+
+    def _get_fight_cache(self):
+        if self._fight_cache is None and self.fight_cache_size > 0:
+            self._fight_cache = FightCache(self.fight_cache_size, self.fight_cache_file, self._fight_settings())
+            self._fight_cache.load()
+
+        return self._fight_cache
+
+    def _fight_settings(self):
+        # Everything besides the genomes and the seed which changes the outcome of a fight
+        return (self.activation_func.__name__, self.action_selection.__name__, self.decision_interval,
+                [termination.__name__ for termination in self.terminations], NUMBER_OF_FRAMES)
+
+    def _start_journal(self):
+        '''
+            Starts the journal with the genomes as they are evaluated - after the clone policy changed them.
+            The outcomes of a resumed evaluation of this generation are carried over to the new journal.
+        '''
+        if not self.evaluation_journal_file:
+            self._journal_outcomes = {}
+            return None
+
+        journal = EvaluationJournal(self.evaluation_journal_file, self._fight_settings())
+        journal.start(self.seed, self._generation, self._genomes, self._journal_outcomes)
+
+        return journal
+
+    def resume_evaluation(self):
+        '''
+            Takes over the generation from the evaluation journal when its evaluation was stopped before it finished,
+            so the next evaluate_population only simulates the fights missing from the journal.
+            The pairs and the seeds of the fights only depend on the seed of the run, the generation and the genomes,
+            so the evaluation picks the same fights again. Returns whether a generation was taken from the journal.
+            Only a journal of this run is taken - one with the same seed, of the current generation when it is not evaluated yet
+            or of a later one when the loaded generation is. A journal of a finished evaluation is never taken.
+        '''
+        if not self.evaluation_journal_file:
+            return False
+
+        journal = EvaluationJournal(self.evaluation_journal_file, self._fight_settings()).load()
+        if journal is None:
+            return False
+
+        seed, generation, genomes, outcomes, finished = journal
+        if finished:
+            return False
+        if seed != self.seed:
+            logger.info(f'The evaluation journal {self.evaluation_journal_file} belongs to another run and is not used')
+            return False
+        if generation < self._generation or (generation > self._generation and not self.is_evaluated) or \
+                (generation == self._generation and self.is_evaluated):
+            logger.info(f'The evaluation journal {self.evaluation_journal_file} of GENERATION #{generation} does not continue '
+                        f'GENERATION #{self._generation} and is not used')
+            return False
+        if genomes.layout.size != self._genomes.layout.size:
+            logger.info(f'The evaluation journal {self.evaluation_journal_file} has networks of another layout and is not used')
+            return False
+
+        self._generation = generation
+        self._population_size = len(genomes.data)
+        self._set_population(genomes, [0] * len(genomes.data))
+        self.is_evaluated = False
+        self._journal_outcomes = outcomes
+        logger.info(f'GENERATION #{generation} is resumed with {len(outcomes)} fights from the evaluation journal')
 
-        pairs = []
-        for net in nets:
-            enemies = np.random.choice(nets_num, NUMBER_OF_FIGHTS_PER_CREATURE)
-            pairs.append((net, [nets[enemy_idx] for enemy_idx in enemies]))
+        return True
 
-        return pairs
+    def _stop_evaluator(self):
+        if self._evaluator is not None:
+            self._evaluator.shutdown()
+            self._evaluator = None
+
+    def shutdown(self):
+        '''
+            Stops the evaluation processes and stores the fight cache. The processes are started again by the next evaluation.
+        '''
+        self._stop_evaluator()
+        if self._fight_cache is not None:
+            self._fight_cache.save()
 
     def create_next_generation(self):
-        selection_performer = self.selection_algorithm(self._population, self.selection_parent_rate)
-        self._population = selection_performer.next_generation()
+        scores = [score for _, score in self._population]
+        selection_performer = self.selection_algorithm(self._genomes, scores, self.selection_parent_rate, self.cross_over)
+        self._set_population(*selection_performer.next_generation())
         self._perform_mutation()
 
         self._generation += 1
         self.is_evaluated = False
+        self.evaluated_fights = []
 
     def _perform_mutation(self):
         mutation = self.mutation_algorithm(self.mutation_rate)
-        for net_pair in self._population:
-            mutation.mutate(net_pair[0])
-
-    def serialize(self, filename):
-        pickle_serialization(self, filename)
+        mutation.mutate_population(self._genomes)
+
+    def _set_population(self, genomes: GenomeMatrix, scores):
+        '''
+            The whole population lives in one GenomeMatrix. The networks of the population are views of its rows.
+        '''
+        self._genomes = genomes
+        self._population = [(NeuralNetwork(self.creator_tag, self.activation_func, self.cross_over, genome=genomes.genome(idx)), score)
+                            for idx, score in enumerate(scores)]
+
+    def __getstate__(self):
+        # The networks are views into the genome matrix, so only their scores are stored next to it
+        state = self.__dict__.copy()
+        state['_population'] = [score for _, score in self._population]
+        state['_evaluator'] = None
+        state['_fight_cache'] = None
+        state['_journal_outcomes'] = {}
+
+        return state
+
+    def __setstate__(self, state):
+        population = state['_population']
+        self.__dict__.update(state)
+        self._evaluator = None
+        self.fights_per_creature = state.get('fights_per_creature', NUMBER_OF_FIGHTS_PER_CREATURE)
+        self.action_selection = state.get('action_selection', ProbabilityActionSelection)
+        self.decision_interval = state.get('decision_interval', 1)
+        self.terminations = state.get('terminations', [])
+        self.racing_survival_rate = state.get('racing_survival_rate', 1.0)
+        self.fight_cache_size = state.get('fight_cache_size', 0)
+        self.fight_cache_file = state.get('fight_cache_file')
+        self.clone_policy = state.get('clone_policy', KeepClones)
+        self.seed = state.get('seed', int(np.random.randint(0, 2 ** 32)))
+        self.fight_deadline = state.get('fight_deadline')
+        self.failed_fights = state.get('failed_fights', [])
+        self.evaluated_fights = state.get('evaluated_fights', [])
+        self.evaluation_journal_file = state.get('evaluation_journal_file')
+        self._journal_outcomes = {}
+        self._fight_cache = None
+
+        # Generations serialized before the genome matrix existed keep whole networks inside the population
+        if '_genomes' not in state:
+            nets = [net for net, _ in population]
+            self.creator_tag = nets[0].creator_tag
+            self.activation_func = nets[0].activation_func
+            self.cross_over = nets[0].cross_over_method
+            self._set_population(GenomeMatrix.from_networks(nets), [score for _, score in population])
+        else:
+            self._set_population(self._genomes, population)
+
+    def serialize(self, filename, random_state=True, writer=None):
+        '''
+            Writes a checkpoint - a JSON header in filename and the genomes in a raw array file next to it, see checkpoint.py.
+            The strategies are stored by the names they are registered under, like in app_config.json.
+            random_state - whether the state of the global numpy RNG is stored, so the run continues exactly as it would have.
+            writer - a CheckpointWriter which writes the checkpoint in the background. The genomes are copied before this returns.
+        '''
+        header, genomes = self._checkpoint(random_state)
+        if writer is None:
+            checkpoint.write_checkpoint(filename, header, genomes)
+            return
+
+        writer.submit(filename, lambda: checkpoint.write_checkpoint(filename, header, genomes))
+
+    def _checkpoint(self, random_state):
+        header = {
+            'generation': self._generation,
+            'population_size': self._population_size,
+            'is_evaluated': self.is_evaluated,
+            'creator_tag': self.creator_tag,
+            'config': {
+                'fitness_func': checkpoint.function_name(self.fitness_func),
+                'activation_func': checkpoint.mapper_name(FunctionMapper, self.activation_func),
+                'selection_type': checkpoint.mapper_name(SelectionMapper, self.selection_algorithm),
+                'previous_generation_rate': self.selection_parent_rate,
+                'mutation_type': checkpoint.mapper_name(MutationMapper, self.mutation_algorithm),
+                'mutation_rate': self.mutation_rate,
+                'cross_over_type': checkpoint.mapper_name(CrossOverMapper, self.cross_over),
+                'fights_per_creature': self.fights_per_creature,
+                'action_selection': checkpoint.mapper_name(ActionSelectionMapper, self.action_selection),
+                'decision_interval': self.decision_interval,
+                'early_termination': [checkpoint.mapper_name(TerminationMapper, termination) for termination in self.terminations],
+                'racing_survival_rate': self.racing_survival_rate,
+                'fight_cache_size': self.fight_cache_size,
+                'fight_cache_file': self.fight_cache_file,
+                'clone_policy': checkpoint.mapper_name(ClonePolicyMapper, self.clone_policy),
+                'seed': self.seed,
+                'fight_deadline_s': self.fight_deadline,
+                'evaluation_journal_file': self.evaluation_journal_file,
+            },
+            'layout': {'matrix_shapes': self._genomes.layout.matrix_shapes, 'bias_shapes': self._genomes.layout.bias_shapes},
+            'scores': [float(score) for _, score in self._population],
+            'generations_fitness': [float(fitness) for fitness in self.generations_fitness],
+            'evaluated_fights': [[int(value) for value in fight] for fight in self.evaluated_fights],
+            'random_state': checkpoint.random_state_to_json(np.random.get_state()) if random_state else None,
+        }
+
+        return header, np.array(self._genomes.data)
 
     @staticmethod
-    def deserialize(filename):
-        with open(filename, 'rb') as binary_file:
-            return pickle.load(binary_file)
+    def deserialize(filename, mmap_mode='c'):
+        '''
+            Reads a checkpoint written by serialize and sets the global numpy RNG to the state stored in it.
+            The genomes are mapped to memory with mmap_mode, see checkpoint.read_checkpoint.
+            Generations pickled before the checkpoints existed are still read, convert_generation.py turns them into checkpoints.
+        '''
+        if not checkpoint.is_checkpoint(filename):
+            logger.info(f'{filename} is a pickled generation, run python convert_generation.py to turn it into a checkpoint')
+            with open(filename, 'rb') as binary_file:
+                return pickle.load(binary_file)
+
+        header, genomes = checkpoint.read_checkpoint(filename, mmap_mode)
+        config = header['config']
+        layout = GenomeLayout(header['layout']['matrix_shapes'], header['layout']['bias_shapes'])
+
+        genetic_algorithm = GeneticEvolution.__new__(GeneticEvolution)
+        genetic_algorithm.__setstate__({
+            '_generation': header['generation'],
+            '_population_size': header['population_size'],
+            'is_evaluated': header['is_evaluated'],
+            'creator_tag': header['creator_tag'],
+            'fitness_func': checkpoint.import_function(config['fitness_func']),
+            'activation_func': FunctionMapper.get_func(config['activation_func']),
+            'selection_algorithm': SelectionMapper.get_selection(config['selection_type']),
+            'selection_parent_rate': config['previous_generation_rate'],
+            'mutation_algorithm': MutationMapper.get_mutation(config['mutation_type']),
+            'mutation_rate': config['mutation_rate'],
+            'cross_over': CrossOverMapper.get_cross_over(config['cross_over_type']),
+            'fights_per_creature': config['fights_per_creature'],
+            'action_selection': ActionSelectionMapper.get_action_selection(config['action_selection']),
+            'decision_interval': config['decision_interval'],
+            'terminations': TerminationMapper.get_terminations(config['early_termination']),
+            'racing_survival_rate': config['racing_survival_rate'],
+            'fight_cache_size': config['fight_cache_size'],
+            'fight_cache_file': config['fight_cache_file'],
+            'clone_policy': ClonePolicyMapper.get_clone_policy(config['clone_policy']),
+            'seed': config['seed'],
+            'fight_deadline': config['fight_deadline_s'],
+            'evaluation_journal_file': config['evaluation_journal_file'],
+            'generations_fitness': header['generations_fitness'],
+            # Checkpoints written before the fights were stored do not have them
+            'evaluated_fights': [tuple(fight) for fight in header.get('evaluated_fights', [])],
+            '_genomes': GenomeMatrix(layout, genomes),
+            '_population': header['scores'],
+        })
+
+        if header['random_state'] is not None:
+            np.random.set_state(checkpoint.random_state_from_json(header['random_state']))
+
+        return genetic_algorithm
@@ -0,0 +1,214 @@
+import hashlib
+import numpy as np
+
+from multiprocessing import shared_memory
+
+
+def genome_hash(genome):
+    '''
+        Content hash of a flat genome. Genomes with the same weights get the same hash in every process and every run.
+    '''
+    digest = hashlib.blake2b(np.ascontiguousarray(genome).tobytes(), digest_size=8).digest()
+
+    return int.from_bytes(digest, 'little')
+
+
+class GenomeLayout:
+    def __init__(self, matrix_shapes, bias_shapes):
+        '''
+            Describes where the weight matrices and the biases of a neural network are placed inside a flat genome.
+            The parameters are stored layer by layer - matrix 0, bias 0, matrix 1, bias 1 and so on.
+            Matrices are stored row by row, so every row (all the weights of a node) is a contiguous slice.
+        '''
+        self.matrix_shapes = [tuple(shape) for shape in matrix_shapes]
+        self.bias_shapes = [tuple(shape) for shape in bias_shapes]
+
+        self.matrix_offsets = []
+        self.bias_offsets = []
+        offset = 0
+        for matrix_shape, bias_shape in zip(self.matrix_shapes, self.bias_shapes):
+            self.matrix_offsets.append(offset)
+            offset += int(np.prod(matrix_shape))
+            self.bias_offsets.append(offset)
+            offset += int(np.prod(bias_shape))
+
+        self.size = offset
+
+        # A segment is a unit the genetic operators work on - a row of a matrix (the weights of a node) or a whole bias
+        segment_starts = []
+        segment_lengths = []
+        for layer, (rows, columns) in enumerate(self.matrix_shapes):
+            matrix_offset = self.matrix_offsets[layer]
+            segment_starts.extend(matrix_offset + row * columns for row in range(rows))
+            segment_lengths.extend([columns] * rows)
+            segment_starts.append(self.bias_offsets[layer])
+            segment_lengths.append(int(np.prod(self.bias_shapes[layer])))
+
+        self.segment_starts = np.array(segment_starts, dtype=np.int64)
+        self.segment_lengths = np.array(segment_lengths, dtype=np.int64)
+        # For every parameter - the segment it belongs to and its position inside that segment
+        self.segment_ids = np.repeat(np.arange(len(self.segment_starts)), self.segment_lengths)
+        self.segment_positions = np.arange(self.size) - np.repeat(self.segment_starts, self.segment_lengths)
+
+    @staticmethod
+    def for_network(input_nodes, nodes_per_layer, hidden_layers, output_nodes):
+        layer_sizes = [input_nodes] + [nodes_per_layer] * hidden_layers + [output_nodes]
+        matrix_shapes = [(layer_sizes[idx], layer_sizes[idx + 1]) for idx in range(len(layer_sizes) - 1)]
+        bias_shapes = [(layer_sizes[idx + 1],) for idx in range(len(layer_sizes) - 1)]
+
+        return GenomeLayout(matrix_shapes, bias_shapes)
+
+    def matrices(self, genome):
+        '''
+            Returns the weight matrices as views into the genome, so writing to them changes the genome.
+            For a 2-D array of genomes every matrix gets a leading dimension with one entry per genome.
+        '''
+        return [genome[..., offset: offset + int(np.prod(shape))].reshape(genome.shape[:-1] + shape)
+                for offset, shape in zip(self.matrix_offsets, self.matrix_shapes)]
+
+    def biases(self, genome):
+        '''
+            Returns the biases as views into the genome, so writing to them changes the genome.
+            For a 2-D array of genomes every bias gets a leading dimension with one entry per genome.
+        '''
+        return [genome[..., offset: offset + int(np.prod(shape))]
+                for offset, shape in zip(self.bias_offsets, self.bias_shapes)]
+
+    def flatten(self, matrices, biases):
+        genome = np.empty(self.size, dtype=np.result_type(*matrices, *biases))
+        for matrix_view, matrix in zip(self.matrices(genome), matrices):
+            matrix_view[:] = matrix
+        for bias_view, bias in zip(self.biases(genome), biases):
+            bias_view[:] = bias
+
+        return genome
+
+    def __eq__(self, other):
+        return isinstance(other, GenomeLayout) and \
+            self.matrix_shapes == other.matrix_shapes and self.bias_shapes == other.bias_shapes
+
+    def __hash__(self):
+        return hash((tuple(self.matrix_shapes), tuple(self.bias_shapes)))
+
+
+class GenomeMatrix:
+    def __init__(self, layout: GenomeLayout, data):
+        '''
+            Keeps the genomes of a whole population in one contiguous array of shape (population, layout.size).
+            Row i is the flat genome of creature i, the layout tells how to split it into matrices and biases.
+        '''
+        if data.ndim != 2 or data.shape[1] != layout.size:
+            raise ValueError(f'Genome data of shape {data.shape} does not match a layout of {layout.size} parameters')
+
+        self.layout = layout
+        self.data = np.ascontiguousarray(data)
+
+    @staticmethod
+    def random(layout: GenomeLayout, population_size, dtype=np.float64):
+        data = np.random.uniform(low=-1, high=1, size=(population_size, layout.size)).astype(dtype, copy=False)
+
+        return GenomeMatrix(layout, data)
+
+    @staticmethod
+    def from_networks(neural_nets, dtype=None):
+        '''
+            Copies the genomes of the given networks into a new matrix. The networks keep their own genomes.
+        '''
+        layout = neural_nets[0].layout
+        data = np.stack([net.genome for net in neural_nets])
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+
+        return GenomeMatrix(layout, data)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def __len__(self):
+        return len(self.data)
+
+    def genome(self, idx):
+        return self.data[idx]
+
+    def take(self, indices):
+        return GenomeMatrix(self.layout, self.data[indices])
+
+    def hashes(self):
+        return [genome_hash(genome) for genome in self.data]
+
+    def originals(self):
+        '''
+            For every genome the index of the first genome with the same weights - its own index when there is none before it.
+        '''
+        first = {}
+
+        return np.array([first.setdefault(content_hash, idx) for idx, content_hash in enumerate(self.hashes())], dtype=np.int64)
+
+    def breed(self, pairs, cross_over):
+        '''
+            Performs the cross over for all (parent1, parent2) index pairs at once.
+            The two children of pair i are placed at rows 2 * i and 2 * i + 1 of the returned matrix.
+        '''
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        children1, children2 = cross_over().perform_population(self.data[pairs[:, 0]], self.data[pairs[:, 1]], self.layout)
+
+        children = np.empty((2 * len(pairs), self.layout.size), dtype=self.dtype)
+        children[0::2] = children1
+        children[1::2] = children2
+
+        return GenomeMatrix(self.layout, children)
+
+
+class SharedGenomeMatrix:
+    def __init__(self, genomes: GenomeMatrix):
+        '''
+            Publishes a copy of a GenomeMatrix in a shared memory block.
+            Other processes map it through SharedGenomeReader, only the small descriptor has to be sent to them.
+        '''
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(genomes.data.nbytes, 1))
+        data = np.ndarray(genomes.data.shape, dtype=genomes.dtype, buffer=self.shared_memory.buf)
+        data[:] = genomes.data
+        del data
+
+        self.descriptor = (self.shared_memory.name, genomes.data.shape, genomes.dtype.str, genomes.layout)
+
+    def close(self):
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+class SharedGenomeReader:
+    def __init__(self):
+        '''
+            Maps the genome matrix published by SharedGenomeMatrix as a read-only GenomeMatrix.
+            The block stays mapped until a descriptor of another block is given.
+        '''
+        self.name = None
+        self.shared_memory = None
+        self.genomes = None
+
+    def attach(self, descriptor):
+        name, shape, dtype, layout = descriptor
+        if name != self.name:
+            self.detach()
+
+            # The workers share the resource tracker of the publishing process (PopulationEvaluator starts it before them),
+            # so registering the block again on attach changes nothing and it is unlinked only by its owner
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+            data = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.shared_memory.buf)
+            data.flags.writeable = False
+            self.genomes = GenomeMatrix(layout, data)
+            self.name = name
+
+        return self.genomes
+
+    def detach(self):
+        if self.shared_memory is None:
+            return
+
+        # The array has to be released before the block can be closed
+        self.genomes = None
+        self.shared_memory.close()
+        self.shared_memory = None
+        self.name = None
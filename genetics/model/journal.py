@@ -0,0 +1,103 @@
+import os
+import pickle
+import logging
+
+logger = logging.getLogger()
+
+# Last record of the journal of an evaluation which got all its fights
+FINISHED = 'finished'
+
+
+class EvaluationJournal:
+    def __init__(self, path, settings=None):
+        '''
+            File the outcomes of the fights of the generation being evaluated are appended to as soon as they arrive,
+            so an evaluation stopped in the middle can be continued without simulating its fights again.
+            The file starts with a header - the settings, the seed of the run, the generation and its genomes -
+            followed by records of (first_hash, second_hash, seed, side) -> (first_metrics, second_metrics) like in FightCache.
+            finish() closes the journal of a complete evaluation with a FINISHED record, such a journal is never resumed.
+            settings - everything besides the genomes and the seed that changes a fight. A journal is only used with the same settings.
+        '''
+        self.path = path
+        self.settings = settings
+        self.file = None
+
+    def load(self):
+        '''
+            Returns (seed, generation, genomes, outcomes, finished) of the journal, None when there is none or it was made with other settings.
+            A record cut off by a crash in the middle of writing it is left out.
+        '''
+        if not self.path or not os.path.exists(self.path):
+            return None
+
+        outcomes = {}
+        finished = False
+        with open(self.path, 'rb') as binary_file:
+            try:
+                settings, seed, generation, genomes = pickle.load(binary_file)
+            except (EOFError, pickle.UnpicklingError, ValueError):
+                logger.warning(f'The evaluation journal {self.path} has no readable header and is not used')
+                return None
+
+            if settings != self.settings:
+                logger.info(f'The evaluation journal in {self.path} was made with other settings and is not used')
+                return None
+
+            while True:
+                try:
+                    record = pickle.load(binary_file)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, AttributeError):
+                    logger.warning(f'The evaluation journal {self.path} ends with an incomplete record, it is left out')
+                    break
+
+                if record == FINISHED:
+                    finished = True
+                    break
+                outcomes.update(record)
+
+        return seed, generation, genomes, outcomes, finished
+
+    def start(self, seed, generation, genomes, outcomes=None):
+        '''
+            Starts the journal of a new evaluation, the journal of the previous one is overwritten.
+            outcomes - the ones already known, for example from the journal the evaluation was resumed from.
+        '''
+        self.close()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.file = open(self.path, 'wb')
+        pickle.dump((self.settings, seed, generation, genomes), self.file)
+        self._sync()
+        self.append(outcomes)
+
+    def append(self, outcomes):
+        '''
+            Writes the outcomes to the disk before it returns, so they survive the process being killed right after.
+        '''
+        if not outcomes:
+            return
+
+        pickle.dump(outcomes, self.file)
+        self._sync()
+
+    def finish(self):
+        '''
+            Marks the evaluation as complete, so a later run does not take its generation over again.
+        '''
+        pickle.dump(FINISHED, self.file)
+        self._sync()
+        self.close()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
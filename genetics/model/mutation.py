@@ -24,6 +24,9 @@ class Mutation:
     def mutate(self, neural_net):
         raise NotImplementedError()
 
+    def mutate_population(self, genomes):
+        raise NotImplementedError()
+
 
 @MutationMapper("single_weight_per_node")
 class SingleWeightPerNodeMutation(Mutation):
@@ -45,6 +48,17 @@ class SingleWeightPerNodeMutation(Mutation):
                 weight_to_mutate = np.random.choice(len(bias), 1)[0]
                 bias[weight_to_mutate] = np.random.uniform(low=-1, high=1)
 
+    def mutate_population(self, genomes):
+        '''
+            Same as mutate but for every genome of the GenomeMatrix at once.
+            Each chosen genome gets one random weight regenerated in every node row and in every bias.
+        '''
+        chosen = np.flatnonzero(np.random.uniform(low=0, high=1, size=len(genomes)) <= self.rate)
+        layout = genomes.layout
+
+        weights_to_mutate = layout.segment_starts + np.random.randint(0, layout.segment_lengths, size=(len(chosen), len(layout.segment_lengths)))
+        genomes.data[chosen[:, np.newaxis], weights_to_mutate] = np.random.uniform(low=-1, high=1, size=weights_to_mutate.shape)
+
 
 @MutationMapper("all_weights_mutation")
 class AllWeightsMutation(Mutation):
@@ -56,21 +70,29 @@ class AllWeightsMutation(Mutation):
             Given a mutation rate, the mutation goes through each weight inside the neural net.
             Depending on the mutation rate some of them are regenerated.
         '''
-        for idx, layer in enumerate(neural_net.matrices):
+        # The matrices and biases are views into the network genome, so they are updated in place
+        for layer in neural_net.matrices:
             new_values = np.random.uniform(low=-1, high=1, size=layer.shape)
             should_update = np.random.uniform(low=0, high=1, size=layer.shape) < self.rate
             new_values *= should_update
             
             layer *= (1 - should_update)
-            neural_net.matrices[idx] = layer + new_values
+            layer += new_values
         
-        for idx, bias in enumerate(neural_net.biases):
+        for bias in neural_net.biases:
             new_values = np.random.uniform(low=-1, high=1, size=bias.shape)
             should_update = np.random.uniform(low=0, high=1, size=bias.shape) < self.rate
             new_values *= should_update
             
             bias *= (1 - should_update)
-            neural_net.biases[idx] = bias + new_values
+            bias += new_values
+
+    def mutate_population(self, genomes):
+        '''
+            Same as mutate but for every weight of the GenomeMatrix at once.
+        '''
+        should_update = np.random.uniform(low=0, high=1, size=genomes.data.shape) < self.rate
+        genomes.data[should_update] = np.random.uniform(low=-1, high=1, size=np.count_nonzero(should_update))
 
 
 @MutationMapper("all_weights_biased_mutation")
@@ -94,3 +116,10 @@ class AllWeightsBiasedMutation(Mutation):
             should_update = np.random.uniform(low=0, high=1, size=bias.shape) < self.rate
             modifiers *= should_update
             bias += modifiers
+
+    def mutate_population(self, genomes):
+        '''
+            Same as mutate but for every weight of the GenomeMatrix at once.
+        '''
+        should_update = np.random.uniform(low=0, high=1, size=genomes.data.shape) < self.rate
+        genomes.data[should_update] += np.random.uniform(low=-1, high=1, size=np.count_nonzero(should_update))
@@ -4,7 +4,8 @@ import numpy as np
 from numpy.core.fromnumeric import size
 
 
-from .utils import pickle_serialization
+from .genome import GenomeLayout
+from .utils import pickle_serialization, write_atomically
 
 
 class NNRNG:
@@ -18,9 +19,7 @@ class GenericNNRNG(NNRNG):
 
 
 class NeuralNetwork:
-    def __init__(self, creator_tag, activation_func, cross_over, fill_randomly=True):
-        self.matrices = []
-        self.biases = []
+    def __init__(self, creator_tag, activation_func, cross_over, fill_randomly=True, genome=None):
         self.creator_tag = creator_tag
         self.activation_func = activation_func
         self.cross_over_method = cross_over
@@ -30,23 +29,30 @@ class NeuralNetwork:
         self.output_nodes = 4
         self.hidden_layers = 2
         self.nodes_per_layer = 14
-
-        if fill_randomly:
-            # Every element is a matrix with W(ij) elements
-            # W(ij) = the weight from node j to node i
-            # In this way if we want to calculate the value of a node i, we can get the ith row ;)
-            # We need all the edges going towards a certain node, not all going out of a certain node
-            # Bias: last element in the row for the current node.
-            
-            self.matrices.append(np.random.uniform(low=-1, high=1, size=(self.input_nodes, self.nodes_per_layer)))
-            self.biases.append(np.random.uniform(low=-1, high=1, size=self.nodes_per_layer))
-
-            for _ in range(self.hidden_layers - 1):
-                self.matrices.append(np.random.uniform(low=-1, high=1, size=(self.nodes_per_layer, self.nodes_per_layer)))
-                self.biases.append(np.random.uniform(low=-1, high=1, size=self.nodes_per_layer))
-            
-            self.matrices.append(np.random.uniform(low=-1, high=1, size=(self.nodes_per_layer, self.output_nodes)))
-            self.biases.append(np.random.uniform(low=-1, high=1, size=self.output_nodes))
+        self.layout = GenomeLayout.for_network(self.input_nodes, self.nodes_per_layer, self.hidden_layers, self.output_nodes)
+
+        # Every element is a matrix with W(ij) elements
+        # W(ij) = the weight from node j to node i
+        # In this way if we want to calculate the value of a node i, we can get the ith row ;)
+        # We need all the edges going towards a certain node, not all going out of a certain node
+        # Bias: last element in the row for the current node.
+        #
+        # All matrices and biases are views into one flat genome. When the genome is given (e.g. a row of a GenomeMatrix)
+        # the network does not copy it, so it always sees the current population data.
+        if genome is None:
+            if fill_randomly:
+                genome = np.random.uniform(low=-1, high=1, size=self.layout.size)
+            else:
+                genome = np.zeros(self.layout.size)
+        self._bind_genome(genome)
+
+    def _bind_genome(self, genome):
+        if genome.shape != (self.layout.size,):
+            raise ValueError(f'Genome of shape {genome.shape} does not match a layout of {self.layout.size} parameters')
+
+        self.genome = genome
+        self.matrices = self.layout.matrices(genome)
+        self.biases = self.layout.biases(genome)
 
     def forward(self, input_values):
         '''
@@ -62,28 +68,44 @@ class NeuralNetwork:
         return NeuralNetwork.softmax(current_input)
 
     def cross_over(self, other: "NeuralNetwork"):
-        child1 = NeuralNetwork(self.creator_tag, self.activation_func, self.cross_over_method, False)
-        child2 = NeuralNetwork(self.creator_tag, self.activation_func, self.cross_over_method, False)
-
-        method = self.cross_over_method()
-        for i in range(len(self.matrices)):
-            child1.matrices.append(np.zeros(shape=self.matrices[i].shape))
-            child1.biases.append(np.zeros(shape=self.biases[i].shape))
-            child2.matrices.append(np.zeros(shape=self.matrices[i].shape))
-            child2.biases.append(np.zeros(shape=self.biases[i].shape))
-
-            for j in range(self.matrices[i].shape[0]):
-                fst, snd = method.perform(self.matrices[i][j], other.matrices[i][j])
-                child1.matrices[-1][j] = fst
-                child2.matrices[-1][j] = snd
-            fst, snd = method.perform(self.biases[i], other.biases[i])
-            child1.biases[-1] = fst
-            child2.biases[-1] = snd
-
-        return child1, child2
+        child1, child2 = self.cross_over_method().perform_population(self.genome[np.newaxis], other.genome[np.newaxis], self.layout)
+
+        return (NeuralNetwork(self.creator_tag, self.activation_func, self.cross_over_method, genome=child1[0]),
+                NeuralNetwork(self.creator_tag, self.activation_func, self.cross_over_method, genome=child2[0]))
+
+    def __getstate__(self):
+        # Only the flat genome is pickled, the matrices and biases are views recreated on load
+        state = self.__dict__.copy()
+        del state['matrices']
+        del state['biases']
+        state['genome'] = np.array(self.genome)
+
+        return state
+
+    def __setstate__(self, state):
+        state = state.copy()
+        matrices = state.pop('matrices', None)
+        biases = state.pop('biases', None)
+        genome = state.pop('genome', None)
+        self.__dict__.update(state)
+
+        # Networks serialized before the genome layout existed only have separate matrices and biases
+        if 'layout' not in state:
+            self.layout = GenomeLayout.for_network(self.input_nodes, self.nodes_per_layer, self.hidden_layers, self.output_nodes)
+        if genome is None:
+            genome = self.layout.flatten(matrices, biases)
+        self._bind_genome(genome)
+
+    def serialize(self, filename, writer=None):
+        '''
+            writer - a CheckpointWriter which writes the network in the background. The network is copied before this returns.
+        '''
+        if writer is None:
+            pickle_serialization(self, filename)
+            return
 
-    def serialize(self, filename):
-        pickle_serialization(self, filename)
+        data = pickle.dumps(self)
+        writer.submit(filename, lambda: write_atomically(filename, data))
 
     @staticmethod
     def deserialize(filename):
@@ -95,3 +117,68 @@ class NeuralNetwork:
         """Compute softmax values for each sets of scores in x."""
         e_x = np.exp(x - np.max(x))
         return e_x / e_x.sum()
+
+
+class NeuralNetworkBatch:
+    def __init__(self, layout, genomes, activation_func):
+        '''
+            Stacks the weights of networks sharing the same layout and activation function into 3-D tensors.
+            genomes is a (networks, layout.size) array, matrices[i] gets shape (networks, rows, columns)
+            and biases[i] gets shape (networks, 1, columns).
+        '''
+        self.activation_func = activation_func
+        self.matrices = [np.ascontiguousarray(matrix) for matrix in layout.matrices(genomes)]
+        self.biases = [np.ascontiguousarray(bias)[:, np.newaxis, :] for bias in layout.biases(genomes)]
+
+    @staticmethod
+    def from_networks(neural_nets):
+        if len(neural_nets) == 0:
+            raise ValueError('At least one neural network is required for a batch')
+
+        activation_func = neural_nets[0].activation_func
+        if any(net.activation_func is not activation_func for net in neural_nets):
+            raise ValueError('All neural networks in a batch must use the same activation function')
+
+        return NeuralNetworkBatch(neural_nets[0].layout, np.stack([net.genome for net in neural_nets]), activation_func)
+
+    @staticmethod
+    def from_genomes(genomes, indices, activation_func):
+        '''
+            Creates a batch straight from rows of a GenomeMatrix, without building NeuralNetwork objects.
+        '''
+        return NeuralNetworkBatch(genomes.layout, genomes.data[indices], activation_func)
+
+    def __len__(self):
+        return len(self.matrices[0])
+
+    def take(self, indices):
+        '''
+            Returns a batch with only the networks at the given indices.
+        '''
+        batch = NeuralNetworkBatch.__new__(NeuralNetworkBatch)
+        batch.activation_func = self.activation_func
+        batch.matrices = [matrix[indices] for matrix in self.matrices]
+        batch.biases = [bias[indices] for bias in self.biases]
+
+        return batch
+
+    def forward(self, input_values):
+        '''
+            Performs forward propagation for every network at once. Row i of input_values is fed to network i.
+            Returns a (networks, output_nodes) array where each row is the softmax output of its network.
+        '''
+        current_input = np.asarray(input_values, dtype=np.float64)[:, np.newaxis, :]
+        for idx, matrix in enumerate(self.matrices):
+            current_input = np.matmul(current_input, matrix)
+            current_input += self.biases[idx]
+            current_input = self.activation_func(current_input)
+
+        return NeuralNetworkBatch.softmax(current_input[:, 0, :])
+
+    @staticmethod
+    def softmax(x):
+        """Compute softmax values for each row of x in place."""
+        x -= np.max(x, axis=1, keepdims=True)
+        np.exp(x, out=x)
+        x /= x.sum(axis=1, keepdims=True)
+        return x
@@ -1,5 +1,9 @@
+import logging
 import numpy as np
-from .utils import get_nearest_combination_k
+from .genome import GenomeMatrix
+from .utils import get_nearest_combination_k, AliasTable
+
+logger = logging.getLogger()
 
 
 class SelectionMapper:
@@ -19,10 +23,12 @@ class SelectionMapper:
 
 
 class Selection:
-    def __init__(self, population, keep_parent_rate):
-        self.population = population
-        self.population_size = len(population)
+    def __init__(self, genomes: GenomeMatrix, scores, keep_parent_rate, cross_over):
+        self.genomes = genomes
+        self.scores = list(scores)
+        self.population_size = len(genomes)
         self.parent_rate = keep_parent_rate
+        self.cross_over = cross_over
 
     def next_generation(self):
         raise NotImplementedError()
@@ -30,12 +36,29 @@ class Selection:
     def _choose_parents(self):
         raise NotImplementedError()
 
+    def _children_pairs_needed(self, parents_count):
+        return (self.population_size - parents_count + 1) // 2
+
+    def _create_generation(self, parents, pairs):
+        '''
+            The parents are taken to the next generation as they are, followed by the children of all pairs.
+            All children are created by a single cross over of the genome matrix.
+            Returns the GenomeMatrix of the next generation and its scores (0 for the children).
+        '''
+        parents = np.asarray(parents, dtype=np.int64)
+        children = self.genomes.breed(pairs, self.cross_over)
+
+        data = np.concatenate([self.genomes.data[parents], children.data])[0: self.population_size]
+        scores = [self.scores[idx] for idx in parents] + [0] * len(children)
+
+        return GenomeMatrix(self.genomes.layout, data), scores[0: self.population_size]
+
 
 @SelectionMapper("pair_best_ones")
 class PairBestOnes(Selection):
-    def __init__(self, population, keep_parent_rate):
-        super().__init__(population, keep_parent_rate)
-        self.reproduction_size = get_nearest_combination_k(len(population))
+    def __init__(self, genomes, scores, keep_parent_rate, cross_over):
+        super().__init__(genomes, scores, keep_parent_rate, cross_over)
+        self.reproduction_size = get_nearest_combination_k(len(genomes))
 
     def next_generation(self):
         '''
@@ -43,26 +66,28 @@ class PairBestOnes(Selection):
             All possible pairs are generated until the new generation size exceed the required size.
             How is K chosen? Binary search power which you can check inside utils.py file.
         '''
-        next_generation = self._choose_parents()
+        parents = self._choose_parents()
+        pairs_needed = self._children_pairs_needed(len(parents))
+
+        pairs = []
         for i in range(self.reproduction_size):
             for j in range(i + 1, self.reproduction_size):
-                child1, child2 = self.population[i][0].cross_over(self.population[j][0])
-                next_generation.extend([(child1, 0), (child2, 0)])
+                pairs.append((i, j))
 
-        return next_generation[0: self.population_size]
+        return self._create_generation(parents, pairs[0: pairs_needed])
 
     def _choose_parents(self):
         if self.parent_rate == 0:
             return []
 
-        end = int(len(self.population) * self.parent_rate)
-        return self.population[0:end]
+        end = int(self.population_size * self.parent_rate)
+        return list(range(end))
 
 
 @SelectionMapper("roulette")
 class RouletteSelection(Selection):
-    def __init__(self, population, keep_parent_rate):
-        super().__init__(population, keep_parent_rate)
+    def __init__(self, genomes, scores, keep_parent_rate, cross_over):
+        super().__init__(genomes, scores, keep_parent_rate, cross_over)
         self._create_wheel()
 
     def next_generation(self):
@@ -70,50 +95,52 @@ class RouletteSelection(Selection):
             A neural net is chosen for reproduction according the probability it has.
             The probability is calculated based on the fitness value.
         '''
-        next_generation = self._choose_parents()
-        while len(next_generation) < self.population_size:
-            net1_id = self._choose_element()
-            net2_id = self._choose_element()
-            if net1_id == net2_id:
-                print(f'Same nets chosen for reproduction. Skipping...')
+        parents = self._choose_parents()
+        pairs = self._choose_elements(2 * self._children_pairs_needed(len(parents))).reshape(-1, 2)
 
-            child1, child2 = self.population[net1_id][0].cross_over(self.population[net2_id][0])
-            next_generation.extend([(child1, 0), (child2, 0)])
+        # A net paired with itself is still crossed over, its children are clones which the clone policy deals with
+        same_nets = np.count_nonzero(pairs[:, 0] == pairs[:, 1])
+        if same_nets > 0:
+            logger.debug(f'The same net was chosen as both parents of {same_nets} pairs')
 
-        return next_generation[0: self.population_size]
+        return self._create_generation(parents, pairs)
 
     def _create_wheel(self):
-        wheel = list(map(lambda pair: pair[1], self.population))
-        for i in range(1, len(wheel)):
-            wheel[i] += wheel[i - 1]
+        # All parents are drawn from an alias table, so every draw takes constant time
+        self.wheel = AliasTable(self.scores)
 
-        self.wheel = wheel
+    def _choose_elements(self, amount):
+        return self.wheel.draw(amount)
 
-    def _choose_element(self):
-        dice = np.random.uniform(low=0, high=self.wheel[-1])
-        start = 0
-        end = len(self.wheel)
+    def _choose_parents(self):
+        amount = int(self.population_size * self.parent_rate)
+
+        return [0] + list(self._choose_elements(amount))
 
-        neural_net = -1
-        while start <= end:
-            middle = start + (end - start) // 2
 
-            # We want to get the first bigger than the dice
-            if self.wheel[middle] >= dice:
-                neural_net = middle
-                end = middle - 1
-            else:
-                start = middle + 1
+@SelectionMapper("stochastic_universal")
+class StochasticUniversalSelection(RouletteSelection):
+    def _create_wheel(self):
+        wheel = np.cumsum(self.scores, dtype=np.float64)
 
-        return neural_net
+        # Without any fitness every creature gets an equal slice of the wheel
+        if len(wheel) == 0 or wheel[-1] <= 0:
+            wheel = np.arange(1, self.population_size + 1, dtype=np.float64)
 
-    def _choose_parents(self):
-        parents = []
-        parents.append(self.population[0])
+        self.wheel = wheel
+
+    def _choose_elements(self, amount):
+        '''
+            All elements are chosen with a single spin - the pointers are evenly spaced on the wheel.
+            That way the number of times a creature is chosen stays close to its expected value.
+        '''
+        if amount == 0:
+            return np.empty(0, dtype=np.int64)
 
-        amount = int(len(self.population) * self.parent_rate)
-        for _ in range(amount):
-            pair = self.population[self._choose_element()]
-            parents.append(pair)
+        distance = self.wheel[-1] / amount
+        pointers = np.random.uniform(low=0, high=distance) + distance * np.arange(amount)
+        chosen = np.minimum(np.searchsorted(self.wheel, pointers, side='right'), self.population_size - 1)
 
-        return parents
+        # The pointers come out ordered, so they are shuffled before being paired for reproduction
+        np.random.shuffle(chosen)
+        return chosen
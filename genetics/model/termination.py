@@ -0,0 +1,95 @@
+import math
+import numpy as np
+
+from genetics.agent import MAX_RELOAD_TIME
+
+# Every that many frames the arenas check whether a fight can be stopped
+TERMINATION_CHECK_INTERVAL = 30
+# Frames without a single shot after which nothing is expected to happen anymore
+NO_SHOTS_WINDOW = 600
+# Frames both agents have to spend next to a corner to count as stuck there
+CORNERS_WINDOW = 300
+
+
+class TerminationMapper:
+    mapper = {}
+
+    def __init__(self, termination_type):
+        self.termination_type = termination_type
+
+    def __call__(self, termination_class):
+        TerminationMapper.mapper[self.termination_type] = termination_class
+
+        return termination_class
+
+    @classmethod
+    def get_termination(self, termination_type):
+        return self.mapper[termination_type]
+
+    @classmethod
+    def get_terminations(self, termination_types):
+        return [self.mapper[termination_type] for termination_type in termination_types or []]
+
+
+class FightProgress:
+    def __init__(self, frame, frames, seconds_left, last_shot_frame, bullets_in_flight, corner_streak, successful_shots):
+        '''
+            The state of a number of fights the termination predicates decide on.
+            frame, frames and seconds_left are shared by all fights, the rest are arrays with an entry per fight:
+            last_shot_frame and bullets_in_flight of shape (fights,), corner_streak and successful_shots of shape (fights, 2).
+        '''
+        self.frame = frame
+        self.frames = frames
+        self.seconds_left = seconds_left
+        self.last_shot_frame = last_shot_frame
+        self.bullets_in_flight = bullets_in_flight
+        self.corner_streak = corner_streak
+        self.successful_shots = successful_shots
+
+
+class Termination:
+    def is_finished(self, progress: FightProgress):
+        '''
+            Returns a boolean array telling which of the fights can be stopped.
+        '''
+        raise NotImplementedError()
+
+
+@TerminationMapper("no_shots")
+class NoShotsTermination(Termination):
+    '''
+        Nobody fired for NO_SHOTS_WINDOW frames and no bullet is in the air. Most early random networks never shoot at all.
+    '''
+    def is_finished(self, progress: FightProgress):
+        return (progress.frame - progress.last_shot_frame >= NO_SHOTS_WINDOW) & (progress.bullets_in_flight == 0)
+
+
+@TerminationMapper("corners")
+class CornersTermination(Termination):
+    '''
+        Both agents spent the last CORNERS_WINDOW frames next to a corner and no bullet is in the air.
+    '''
+    def is_finished(self, progress: FightProgress):
+        return (progress.corner_streak >= CORNERS_WINDOW).all(axis=1) & (progress.bullets_in_flight == 0)
+
+
+@TerminationMapper("settled_score")
+class SettledScoreTermination(Termination):
+    '''
+        The agent behind can not catch up anymore - the gap in successful shots is bigger than
+        the bullets in the air plus everything it can still fire with its reload time.
+        The winner does not change, but the leader does not collect the hits it could still make.
+    '''
+    def is_finished(self, progress: FightProgress):
+        gap = np.abs(progress.successful_shots[:, 0] - progress.successful_shots[:, 1])
+        shots_left = math.floor(progress.seconds_left / MAX_RELOAD_TIME) + 1
+
+        return gap > progress.bullets_in_flight + shots_left
+
+
+def finished_fights(terminations, progress: FightProgress):
+    finished = np.zeros(len(progress.last_shot_frame), dtype=bool)
+    for termination in terminations:
+        finished |= termination.is_finished(progress)
+
+    return finished
@@ -21,11 +21,59 @@ def get_nearest_combination_k(population_size):
     return res
 
 
+class AliasTable:
+    def __init__(self, weights):
+        '''
+            Walker's alias table (Vose's construction) for drawing indices proportionally to their weights in O(1).
+            When all weights are zero every index is equally likely.
+        '''
+        weights = np.asarray(weights, dtype=np.float64)
+        size = len(weights)
+        total = weights.sum()
+        scaled = weights * size / total if total > 0 else np.ones(size)
+
+        self.probabilities = np.ones(size)
+        self.aliases = np.arange(size)
+
+        small = [idx for idx in range(size) if scaled[idx] < 1]
+        large = [idx for idx in range(size) if scaled[idx] >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+    def __len__(self):
+        return len(self.probabilities)
+
+    def draw(self, size=None):
+        columns = np.random.randint(0, len(self.probabilities), size=size)
+        keep_column = np.random.uniform(low=0, high=1, size=size) < self.probabilities[columns]
+
+        return np.where(keep_column, columns, self.aliases[columns])
+
+
 def pickle_serialization(object_to_serialize, filename):
-    dirs = filename.split(os.path.sep)[0:-1]
-    if len(dirs) > 0:
-        dirs = os.path.join(*(filename.split(os.path.sep)[0: -1]))
-        os.makedirs(dirs, exist_ok=True)
+    write_atomically(filename, pickle.dumps(object_to_serialize))
+
+
+def write_atomically(filename, data: bytes):
+    '''
+        Writes the data under a temporary name and renames it to filename once it is on the disk,
+        so a crash in the middle of the write never leaves a half written file behind.
+    '''
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
 
-    with open(filename, 'wb') as binary_file:
-        pickle.dump(object_to_serialize, binary_file)
+    with open(filename + '.tmp', 'wb') as binary_file:
+        binary_file.write(data)
+        binary_file.flush()
+        os.fsync(binary_file.fileno())
+    os.replace(filename + '.tmp', filename)
@@ -7,6 +7,7 @@ from genetics.config import Config
 from genetics.world import World
 from genetics.geom import Vec2
 from genetics.model.neuralnet import NeuralNetwork
+from genetics.model.action_selection import ActionSelectionMapper, fight_generators
 from genetics.agent import Agent
 from genetics.actions import ShootAction, RotateAction, MoveAction
 from .screen import Button
@@ -20,8 +21,12 @@ class ArenaScreen(Screen):
 
         self.nn1 = nn1
         self.nn2 = nn2
-        self.agent1 = Agent(self.world, Vec2(50, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn1, (91, 108, 207))
-        self.agent2 = Agent(self.world, Vec2(450, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn2, (216, 43, 83))
+        generators = fight_generators(1)
+        action_selection = ActionSelectionMapper.get_action_selection(Config.get("algorithms.action_selection"))(generators)
+        self.agent1 = Agent(self.world, Vec2(50, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn1, (91, 108, 207),
+                            action_selection, Config.get("algorithms.decision_interval"), generators[0])
+        self.agent2 = Agent(self.world, Vec2(450, 250), [MoveAction(80), RotateAction(math.pi*0.25), RotateAction(-math.pi*0.25), ShootAction(1.0)], nn2, (216, 43, 83),
+                            action_selection, Config.get("algorithms.decision_interval"), generators[0])
         self.world.add_entity(self.agent1)
         self.world.add_entity(self.agent2)
         self.world.set_main_agent(self.agent1)
@@ -7,12 +7,8 @@ import time
 from .screen import Screen, Button, Vec2
 from genetics.config import Config
 
-from genetics.model.fitness_func import fitness_func
 from genetics.model.genetic_evolution import GeneticEvolution
-from genetics.model.mutation import MutationMapper
-from genetics.model.activation_function import FunctionMapper
-from genetics.model.selection import SelectionMapper
-from genetics.model.cross_over import CrossOverMapper
+from genetics.model.checkpoint import CheckpointWriter
 
 
 logging.basicConfig(format='[%(levelname)s] %(asctime)s: %(message)s', level=logging.DEBUG)
@@ -43,16 +39,7 @@ class GenerationScreen(Screen):
         self.register(fight_btn)
 
         self._log_debug()
-        self.genetic_algorithm = GeneticEvolution(
-            Config.get("arena.creature_name_tag"),
-            Config.get("algorithms.population_size"),
-            fitness_func,
-            FunctionMapper.get_func(Config.get("algorithms.activation_func")),
-            SelectionMapper.get_selection(Config.get("algorithms.selection_type")),
-            Config.get("algorithms.previous_generation_rate"),
-            MutationMapper.get_mutation(Config.get("algorithms.mutation_type")),
-            Config.get("algorithms.mutation_rate"),
-            CrossOverMapper.get_cross_over(Config.get("algorithms.cross_over_type")))
+        self.genetic_algorithm = GeneticEvolution.from_config(Config)
 
         self.process_n = Config.get("algorithms.training_process_number")
         self.should_train = False
@@ -108,35 +95,44 @@ class GenerationScreen(Screen):
         gen_serialization_folder = Config.get("serialization.generation_serialization_folder")
         creature_serialization_folder = Config.get("serialization.best_creature_serialization_folder")
 
-        while self.should_train:
-            logger.info(f'GENERATION #{self.genetic_algorithm.current_generation} is being evaluated...')
-            ev_start = time.time()
-            self.genetic_algorithm.evaluate_population(self.process_n)
-            ev_end = time.time()
-            logger.info(f'EVALUATION FINISHED IN {(ev_end - ev_start):.2f}s')
-            logger.info(f'TOP FITNESS FOR GENERATION #{self.genetic_algorithm.current_generation} is {self.genetic_algorithm.top_fitness}\n')
-
-            if self.genetic_algorithm.current_generation % serialization_frequency == 0:
-                self.genetic_algorithm.serialize(os.path.join(gen_serialization_folder, 'generation.data'))
-
-                best_so_far = self.genetic_algorithm.best_network_so_far
-                best_so_far.serialize(os.path.join(creature_serialization_folder, 'creature.net'))
+        # A generation whose evaluation was interrupted is continued with the fights already in the journal
+        self.genetic_algorithm.resume_evaluation()
+        # The checkpoints are written in the background while the next generation is evaluated
+        checkpoint_writer = CheckpointWriter()
+
+        try:
+            while self.should_train:
+                logger.info(f'GENERATION #{self.genetic_algorithm.current_generation} is being evaluated...')
+                ev_start = time.time()
+                self.genetic_algorithm.evaluate_population(self.process_n)
+                ev_end = time.time()
+                logger.info(f'EVALUATION FINISHED IN {(ev_end - ev_start):.2f}s')
+                logger.info(f'TOP FITNESS FOR GENERATION #{self.genetic_algorithm.current_generation} is {self.genetic_algorithm.top_fitness}\n')
+
+                if self.genetic_algorithm.current_generation % serialization_frequency == 0:
+                    self.genetic_algorithm.serialize(os.path.join(gen_serialization_folder, 'generation.data'), writer=checkpoint_writer)
+
+                    best_so_far = self.genetic_algorithm.best_network_so_far
+                    best_so_far.serialize(os.path.join(creature_serialization_folder, 'creature.net'), writer=checkpoint_writer)
             
-            logger.info(f'GENERATION #{self.genetic_algorithm.current_generation + 1} of size {self.genetic_algorithm._population_size} is being created...')
-            try:
-                self.genetic_algorithm.create_next_generation()
-            except Exception as ex:
-                logger.exception('Exception: ')
-                logger.error(ex)
+                logger.info(f'GENERATION #{self.genetic_algorithm.current_generation + 1} of size {self.genetic_algorithm._population_size} is being created...')
+                try:
+                    self.genetic_algorithm.create_next_generation()
+                except Exception as ex:
+                    logger.exception('Exception: ')
+                    logger.error(ex)
 
-            logger.info(f'GENERATION #{self.genetic_algorithm.current_generation} created')
+                logger.info(f'GENERATION #{self.genetic_algorithm.current_generation} created')
 
-        # The last is always evaluated
-        logger.info(f'GENERATION #{self.genetic_algorithm.current_generation} is being evaluated...')
-        self.genetic_algorithm.evaluate_population(self.process_n)
-        logger.info(f'TOP FITNESS FOR GENERATION #{self.genetic_algorithm.current_generation} is {self.genetic_algorithm.top_fitness}\n')
-
-        self.should_join = True
+            # The last is always evaluated
+            logger.info(f'GENERATION #{self.genetic_algorithm.current_generation} is being evaluated...')
+            self.genetic_algorithm.evaluate_population(self.process_n)
+            logger.info(f'TOP FITNESS FOR GENERATION #{self.genetic_algorithm.current_generation} is {self.genetic_algorithm.top_fitness}\n')
+        finally:
+            # The evaluation processes are not needed while the training is paused and the queued checkpoints are written
+            self.genetic_algorithm.shutdown()
+            checkpoint_writer.close()
+            self.should_join = True
 
     def draw_center_text(self, text, font_size, y_pos, surface: pygame.Surface):
         font = pygame.font.SysFont('Arial', font_size)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+import math
+
+
+# Kept off the distance bound of the ring search, so rounding can not stop it before a point just as close
+RING_SLACK = 1e-6
+
+
+class SpatialGrid:
+    def __init__(self, width: float, height: float, cell_size: float):
+        '''
+            Uniform grid over the world which buckets points by the cell they fall in. Points outside of the world
+            are kept in the closest border cell.
+            The grid is built from the coordinates of the points and answers with their indices.
+            It does not watch the points - build() has to be called again after they moved.
+        '''
+        self.cell_size = cell_size
+        self.columns = max(1, math.ceil(width / cell_size))
+        self.rows = max(1, math.ceil(height / cell_size))
+        self.cells = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _cell(self, x, y):
+        column = min(max(int(x // self.cell_size), 0), self.columns - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+
+        return column, row
+
+    def build(self, xs, ys):
+        cells = {}
+        for idx, (x, y) in enumerate(zip(xs, ys)):
+            cells.setdefault(self._cell(x, y), []).append(idx)
+
+        self.cells = cells
+        self.size = len(xs)
+
+    def _ring(self, column, row, ring):
+        '''
+            The cells which are exactly ring cells away from the given one (Chebyshev distance), clipped to the grid.
+        '''
+        if ring == 0:
+            yield column, row
+            return
+
+        for c in range(max(column - ring, 0), min(column + ring, self.columns - 1) + 1):
+            if row - ring >= 0:
+                yield c, row - ring
+            if row + ring < self.rows:
+                yield c, row + ring
+
+        for r in range(max(row - ring + 1, 0), min(row + ring - 1, self.rows - 1) + 1):
+            if column - ring >= 0:
+                yield column - ring, r
+            if column + ring < self.columns:
+                yield column + ring, r
+
+    def nearest(self, x, y, dist2_of):
+        '''
+            Returns the index of the closest point and its squared distance to (x, y), or (None, None) when there is none.
+            dist2_of(idx) - the squared distance of a point to (x, y), inf for a point which does not count.
+            Points at the same distance are won by the lowest index, like a scan over all of them.
+            The cells are searched ring by ring around (x, y) and the search stops as soon as no farther ring can hold
+            anything closer or every point was seen.
+        '''
+        column, row = self._cell(x, y)
+        cell_x = x - column * self.cell_size
+        cell_y = y - row * self.cell_size
+        # Distance from the point to the closest side of its cell
+        edge = max(0.0, min(cell_x, self.cell_size - cell_x, cell_y, self.cell_size - cell_y))
+
+        best = None
+        best_dist2 = math.inf
+        seen = 0
+        max_ring = max(column, self.columns - 1 - column, row, self.rows - 1 - row)
+        rings = range(max_ring + 1)
+        occupied = None
+        if len(self.cells) <= max_ring:
+            # A sparse grid is cheaper to walk by its few occupied cells than by all cells of every ring.
+            # Empty rings are skipped, nothing in them could stop the search earlier
+            occupied = {}
+            for cell in self.cells:
+                occupied.setdefault(max(abs(cell[0] - column), abs(cell[1] - row)), []).append(cell)
+            rings = sorted(occupied)
+
+        for ring in rings:
+            for cell in (occupied[ring] if occupied is not None else self._ring(column, row, ring)):
+                bucket = self.cells.get(cell)
+                if bucket is None:
+                    continue
+
+                seen += len(bucket)
+                for idx in bucket:
+                    dist2 = dist2_of(idx)
+                    if dist2 < best_dist2 or (dist2 == best_dist2 and best is not None and idx < best):
+                        best_dist2 = dist2
+                        best = idx
+
+            if seen == self.size:
+                break
+            # Everything in the next ring is at least that far away. The search goes on at equal distance,
+            # a point there with a lower index would win the tie
+            reach = ring * self.cell_size + edge - RING_SLACK
+            if reach > 0 and best_dist2 < reach * reach:
+                break
+
+        if best is None:
+            return None, None
+
+        return best, best_dist2
+
+    def within(self, x, y, radius, dist2_of):
+        '''
+            Returns the sorted indices of the points closer than radius to (x, y).
+            dist2_of(idx) - the squared distance of a point to (x, y), inf for a point which does not count.
+        '''
+        first_column, first_row = self._cell(x - radius, y - radius)
+        last_column, last_row = self._cell(x + radius, y + radius)
+        radius2 = radius * radius
+
+        found = []
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                bucket = self.cells.get((column, row))
+                if bucket is None:
+                    continue
+
+                found.extend(idx for idx in bucket if dist2_of(idx) < radius2)
+
+        found.sort()
+
+        return found
@@ -1,9 +1,16 @@
 from __future__ import annotations
 from .geom import Vec2
+from .bullets import BulletPool, BULLET_HALF_SIZE
+from .spatial import SpatialGrid
 
+import math
 import pygame
 
 
+# Side of the grid cells the entities are bucketed in
+ENTITY_CELL_SIZE = 50
+
+
 class World:
     def __init__(self, pos: Vec2, size: Vec2, should_render=True):
         self.entities = []
@@ -12,6 +19,19 @@ class World:
         self.diagonal = size.norm()
         self.agent = None
 
+        # Constant geometry the agents check their position against every tick
+        self.corners = [Vec2(0, 0), Vec2(0, size.y), Vec2(size.x, 0), Vec2(size.x, size.y)]
+        self.corner_offset = 0.05 * self.diagonal
+        self.x_offset = 0.05 * size.x
+        self.y_offset = 0.05 * size.y
+        # Number of updates so far, cached per-frame data of the entities is keyed by it
+        self.frame = 0
+        # The bullets are not entities - they live in a pool and are moved all at once
+        self.bullets = BulletPool(size.x, size.y)
+        # Grid over the positions of the entities, built again by the first query after one of them ticked
+        self.entity_grid = SpatialGrid(size.x, size.y, ENTITY_CELL_SIZE)
+        self._entity_grid_valid = False
+
         if should_render:
             self.font = pygame.font.SysFont('Arial', 40)
             self.nn_text = self.font.render('Neural Network', True, (0, 0, 0))
@@ -22,15 +42,80 @@ class World:
 
     def add_entity(self, ent: Entity):
         self.entities.append(ent)
+        self._entity_grid_valid = False
+
+    def _indexed_entity_grid(self):
+        if not self._entity_grid_valid:
+            self.entity_grid.build([entity.position.x for entity in self.entities], [entity.position.y for entity in self.entities])
+            self._entity_grid_valid = True
+
+        return self.entity_grid
+
+    def add_bullet(self, x: float, y: float, forward_vector: Vec2, speed: float, power: float, owner: Entity):
+        return self.bullets.add(x, y, forward_vector.x, forward_vector.y, speed, power, owner)
+
+    def nearest_body(self, position: Vec2, exclude: Entity):
+        '''
+            Returns the closest entity other than the bullets and exclude together with its distance.
+            When there is none - (None, diagonal of the world).
+        '''
+        if not self.entities:
+            return None, self.diagonal
+
+        grid = self._indexed_entity_grid()
+
+        def dist2_of(idx):
+            entity = self.entities[idx]
+            if entity is exclude:
+                return math.inf
+
+            dx = position.x - entity.position.x
+            dy = position.y - entity.position.y
+            # Squared the same way as Vec2.norm, so the distances match the ones computed from vectors to the last bit
+            return dx ** 2 + dy ** 2
+
+        body, dist2 = grid.nearest(position.x, position.y, dist2_of)
+        if body is None:
+            return None, self.diagonal
+
+        return self.entities[body], math.sqrt(dist2)
+
+    def nearest_bullet(self, position: Vec2, ignore_owner: Entity):
+        '''
+            Returns the index of the closest bullet which was not shot by ignore_owner together with its distance.
+            When there is none - (None, diagonal of the world).
+        '''
+        bullet, dist2 = self.bullets.nearest(position.x, position.y, ignore_owner)
+        if bullet is None:
+            return None, self.diagonal
+
+        return bullet, math.sqrt(dist2)
+
+    def colliding_bullets(self, ent: CollidableEntity):
+        '''
+            Returns the indices of the bullets which collide with the entity and were not shot by it.
+        '''
+        radius = ent.half_size.x + BULLET_HALF_SIZE
+
+        return self.bullets.within(ent.position.x, ent.position.y, radius, ent)
 
     def update(self, delta_s: float):
-        for e in self.entities:
-            # We destroy entities that were marked as destroyed during the previous update
-            if e.mark_destroy:
-                self.entities.remove(e)
-                continue
+        self.frame += 1
 
+        # We destroy entities that were marked as destroyed during the previous update
+        if any(e.mark_destroy for e in self.entities):
+            self.entities = [e for e in self.entities if not e.mark_destroy]
+            self._entity_grid_valid = False
+
+        for e in self.entities:
             e.tick(delta_s)
+            # The entity may have moved, the next query sees where it is now
+            self._entity_grid_valid = False
+
+        # The bullets hit during this update and the ones which left the world during the previous one are gone
+        # before the rest move
+        self.bullets.remove_destroyed()
+        self.bullets.tick(delta_s, self.size.x, self.size.y)
 
     def draw(self, surface):
         black = (0, 0, 0)
@@ -55,12 +140,15 @@ class World:
         pygame.draw.line(world_surface, black, (0, 0), (0, self.size.y-1), 1)
         for e in self.entities:
             e.draw(world_surface)
+        self.bullets.draw(world_surface)
 
         # Render the world on the screen
         surface.blit(world_surface, self.pos.toilist())
 
 
 class Entity:
+    __slots__ = ('world', 'position', 'mark_destroy')
+
     def __init__(self, world: World, position: Vec2):
         self.world = world
         self.position = position
@@ -77,34 +165,14 @@ class Entity:
 
 
 class CollidableEntity(Entity):
+    __slots__ = ('half_size',)
+
     def __init__(self, world: World, position: Vec2, half_size: Vec2):
         super().__init__(world, position)
         self.half_size = half_size
 
     def check_collisions(self, c2: CollidableEntity):
-        distance = (self.position - c2.position).norm()
+        distance = self.position.dist(c2.position)
 
         # Since the objects are round
         return distance < self.half_size.x + c2.half_size.x
-
-
-class Bullet(CollidableEntity):
-    def __init__(self, world: World, base_pos: Vec2, forward_vector: Vec2, speed: float, power: float, owner: "Agent"):
-        super().__init__(world, base_pos, Vec2(2, 2))
-        self.forward_vector = forward_vector
-        self.speed = speed
-        self.power = power
-        self.owner = owner
-
-    def tick(self, delta_s: float):
-        self.position = self.position + (self.forward_vector * self.speed * delta_s)
-
-        # Out of bounds check
-        if self.position.x > self.world.size.x or self.position.x < 0:
-            self.destroy()
-
-        if self.position.y > self.world.size.y or self.position.y < 0:
-            self.destroy()
-
-    def draw(self, surface):
-        pygame.draw.circle(surface, (0, 0, 0), self.position.toilist(), 2)
@@ -1,13 +1,20 @@
-import pickle
 import matplotlib.pyplot as plt
 
+from genetics.model.genetic_evolution import GeneticEvolution
+from genetics.model.checkpoint import is_checkpoint, read_header
 
-def load_fitness_history():
-    with open('generations/generation_200_700ep_max.data', 'rb') as max_action_file:
-        max_action_history = pickle.load(max_action_file).generations_fitness
 
-    with open('generations/generation_200_712ep_probs.data', 'rb') as prob_action_file:
-        prob_action_history = pickle.load(prob_action_file).generations_fitness
+def load_generations_fitness(path):
+    # The history is in the header of a checkpoint, the genomes file next to it is not needed
+    if is_checkpoint(path):
+        return read_header(path)['generations_fitness']
+
+    return GeneticEvolution.deserialize(path).generations_fitness
+
+
+def load_fitness_history():
+    max_action_history = load_generations_fitness('generations/generation_200_700ep_max.data')
+    prob_action_history = load_generations_fitness('generations/generation_200_712ep_probs.data')
 
     return max_action_history[:700], prob_action_history[:700]
 
@@ -0,0 +1,95 @@
+import os
+import argparse
+
+from genetics.model.genetic_evolution import GeneticEvolution, NUMBER_OF_FRAMES, simulate_fights
+from genetics.model.evaluation_arena import EvaluationArena
+from genetics.model.neuralnet import NeuralNetwork
+from genetics.model.fight_cache import fight_seed
+from genetics.config import Config
+
+
+METRICS = ['frames', 'shots', 'moves', 'rotations', 'successful_shots', 'bullets_taken', 'time_around_a_corner_percent',
+           'time_around_a_border_percent', 'shots_during_reload_percent', 'shots_while_enemy_in_fov_time_percent',
+           'most_repeated_action_time_percent', 'enemy_in_fov_time_percent', 'enemy_is_close_time_percent']
+
+
+def object_fight(genetic_algorithm, first_idx, second_idx, seed, side):
+    '''
+        Plays the fight with the Agent and World classes the arena screen uses instead of the batched arena.
+    '''
+    genomes = genetic_algorithm.genomes
+    nets = [NeuralNetwork(genetic_algorithm.creator_tag, genetic_algorithm.activation_func, genetic_algorithm.cross_over,
+                          genome=genomes.genome(idx)) for idx in (first_idx, second_idx)]
+    left, right = nets if side == 0 else nets[::-1]
+
+    arena = EvaluationArena(left, right, genetic_algorithm.action_selection, genetic_algorithm.decision_interval,
+                            genetic_algorithm.terminations, seed)
+    left_metrics, right_metrics = arena.perform_fight(NUMBER_OF_FRAMES)
+
+    return (left_metrics, right_metrics) if side == 0 else (right_metrics, left_metrics)
+
+
+def check_fight(parser, genetic_algorithm, hashes, args, seed):
+    '''
+        Any two creatures can be replayed with the seed their fight would get, so the fight is looked up in the fights
+        the evaluation of the stored generation played. Stops with an error when it never happened.
+    '''
+    if not genetic_algorithm.is_evaluated:
+        parser.error('the stored generation is not evaluated yet, so none of its fights happened')
+    if not genetic_algorithm.evaluated_fights:
+        print('The stored generation does not list its fights, the fight is replayed without checking that it happened')
+        return
+
+    played = set(genetic_algorithm.evaluated_fights)
+    if (hashes[args.first], hashes[args.second], seed) in played:
+        return
+
+    swapped = fight_seed(genetic_algorithm.seed, hashes[args.second], hashes[args.first], args.repeat)
+    if (hashes[args.second], hashes[args.first], swapped) in played:
+        parser.error(f'creature {args.second} was the first creature of this fight, run replay.py {args.second} {args.first}')
+
+    opponents = sorted(idx for idx, idx_hash in enumerate(hashes)
+                       if any((hashes[args.first], idx_hash) == fight[:2] for fight in played))
+    played_against = f'was the first creature against {opponents}' if opponents else 'was not the first creature of any fight'
+    parser.error(f'creatures {args.first} and {args.second} did not have fight {args.repeat} in the stored generation, '
+                 f'creature {args.first} {played_against}')
+
+
+def print_metrics(title, metrics):
+    print(title)
+    for name in METRICS:
+        print(f'{name:>40} {getattr(metrics[0], name):>12.4f} {getattr(metrics[1], name):>12.4f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replays a fight of the stored generation exactly the way the training played it. '
+                                                 'The order of the creatures matters, FIRST has to be the creature the fight was '
+                                                 'created for. Pairs which did not fight in the generation are refused.')
+    parser.add_argument('first', type=int, help='index of the first creature of the fight in the stored generation')
+    parser.add_argument('second', type=int, help='index of its opponent in the stored generation')
+    parser.add_argument('--repeat', type=int, default=0, help='which fight of the two creatures in the generation, starting from 0')
+    parser.add_argument('--check', action='store_true', help='plays the fight with the Agent classes as well and compares the metrics')
+    args = parser.parse_args()
+
+    gen_deserialization_folder = Config.get("serialization.generation_deserialization_folder")
+    genetic_algorithm = GeneticEvolution.deserialize(os.path.join(gen_deserialization_folder, 'generation.data'))
+    hashes = genetic_algorithm.genomes.hashes()
+
+    seed = fight_seed(genetic_algorithm.seed, hashes[args.first], hashes[args.second], args.repeat)
+    check_fight(parser, genetic_algorithm, hashes, args, seed)
+    side = seed % 2
+    print(f'Fight seed {seed}, creature {args.first} starts on the {"left" if side == 0 else "right"}')
+
+    metrics = simulate_fights(genetic_algorithm.genomes, [args.first], [args.second], genetic_algorithm.activation_func,
+                              genetic_algorithm.action_selection, genetic_algorithm.decision_interval, genetic_algorithm.terminations,
+                              [seed], [side])[0]
+    print_metrics(f'{"batched arena":>40} {args.first:>12} {args.second:>12}', metrics)
+    print(f'{"score":>40} {genetic_algorithm.fitness_func(metrics[0], metrics[1]):>12} '
+          f'{genetic_algorithm.fitness_func(metrics[1], metrics[0]):>12}')
+
+    if args.check:
+        object_metrics = object_fight(genetic_algorithm, args.first, args.second, seed, side)
+        print_metrics(f'{"object arena":>40} {args.first:>12} {args.second:>12}', object_metrics)
+
+        different = [name for name in METRICS for slot in range(2) if getattr(metrics[slot], name) != getattr(object_metrics[slot], name)]
+        print('Both arenas played the same fight' if not different else f'The arenas differ in {sorted(set(different))}')